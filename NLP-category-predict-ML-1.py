@@ -8,7 +8,6 @@
 import os
 import sys
 import re
-import csv as CSV
 from copy import deepcopy
 import collections as CL
 import itertools as IT
@@ -70,96 +69,64 @@ data_file = os.path.join(PROJ_DIR, "data.txt")
 
 SW = stopwords.words('english')
 
-import re
-ptn_nwc = "[!#$%&'*+/=?`{|}~^.-]"
-ptn_nwc_obj = re.compile(ptn_nwc, re.MULTILINE)
-
-# open the two files
-# read them in
-# normalize: lower case the text 
-# remove end-of-line whitespace
-# remove punctuation
-# tokenize the lines
-
-with open(data_file, mode='r', encoding='utf-8') as fh:
-    d = ( ptn_nwc_obj.sub('', line.strip().lower()).split() 
-         for line in fh.readlines() )
-
-with open(labels_file, mode='r', encoding='utf-8') as fh:
-    l = [ int(line.strip()) for line in fh.readlines() ]    
-    
-# remove 'stop words' (using the NLTK set) &
-# remove words comprised of three letters or fewer
-d = (filter(lambda v: (v not in SW) & (len(v) > 4), line) for line in d)
-d = deepcopy([list(line) for line in d])
-
-# remove frequent terms common to all mobile apps:
-# (generated by scraping the app summaries 
-# from AppData's 1000 most popular mobiles apps)
-DOMAIN_STOP_WORDS = ['android', 'free', 'iphone', 'twitter', 'download', 
-                      'feature', 'features', 'applications', 'application', 
-                      'user', 'users', 'version', 'versions', 'facebook', 
-                      'phone', 'available', 'using', 'information', 'provide',
-                      'include', 'every', 'device', 'mobile', 'friend',
-                      'different', 'please', 'simple', 'email', 'share', 'follow',
-                      'great', 'screen', 'provide', 'acces', 'first', 'sound', 'video',]
-                         
-d = (filter(lambda v: (v not in DOMAIN_STOP_WORDS), line) for line in d)
-
-# normalize: simple word stemming
-def stem(word):
-    if word.endswith('s'):
-        return word[:-1]
-    else:
-        return word
-
-d = (list(map(stem, line)) for line in d)
-
-d1 = deepcopy([list(line) for line in d])
-
-lx = NP.array([len(line) for line in d1])
-
-# ~ 75 lines have 10 words or fewer
-idx = lx > 10
-sum(-idx)
-
-# so (temporarily) filter lines having 10 words or fewer &
-# filter their corresponding class labels
-
-idx = idx.tolist()
-d = IT.compress(d1, idx)
-l = IT.compress(l, idx)
+from corpus_io import read_corpus_parallel
+from stage_cache import StageCache, cached_preprocess
+from text_prep import StopwordFilter, Tokenizer, CachedStemmer, SuffixStemmer
+
+# one pass per line: normalize (lower case the text, remove end-of-line 
+# whitespace, remove punctuation, tokenize), then remove 'stop words' 
+# (the NLTK set plus DOMAIN_STOP_WORDS, frequent terms common to all 
+# mobile apps), remove words comprised of four letters or fewer & 
+# apply simple word stemming
+sw_filter = StopwordFilter(SW, min_word_len=5)
+# (swap in PorterStemmer() for real stemming; the cache absorbs its cost)
+stemmer = CachedStemmer(SuffixStemmer())
+tokenize = Tokenizer(sw_filter, stemmer=stemmer)
+
+# stream the two files in lockstep (the reader raises if they differ
+# in length), tokenizing across a process pool (read_corpus_parallel;
+# pass read=read_corpus for one process), & encode the lines straight
+# into an EncodedCorpus (flat token-id, offset & label arrays), never
+# a list of lists of str;
+# ~ 75 lines have 10 words or fewer, so (temporarily) filter lines 
+# having 10 words or fewer & their corresponding class labels
+
+# both stages are cached on disk, keyed by the files' fingerprints & the
+# tokenizer's config: a rerun w/ unchanged inputs loads the corpus back
+# rather than re-tokenizing; each worker keeps its own stemmer cache
+cache = StageCache(os.path.join(PROJ_DIR, 'stage_cache'))
+corpus = cached_preprocess(data_file, labels_file, tokenize, cache, min_doc_len=11,
+                           read=read_corpus_parallel)
 
 
 # In[98]:
 
 # partition the data & class labels into class I and class 0
 
-d = deepcopy([list(line) for line in d])
-l = deepcopy([line for line in l])
+# shuffle the documents once, w/ an explicit rng rather than the global
+# NP.random state: every matrix built from the corpus below inherits
+# this row order, so nothing downstream shuffles (or copies) it again
+from splits import shuffle_index
 
-assert len(d) == len(l)
+rng = NP.random.default_rng(0)
+# perm[i] is the position in the data file (among kept documents) of row i
+perm = shuffle_index(len(corpus), rng)
+corpus = corpus.subset(perm)
 
-# shuffle both containers
-idx = NP.random.permutation(NP.arange(len(d)))
-d, l = NP.array(d), NP.array(l, dtype='int8')
-d, l = d[idx], l[idx]
+# split by class: index arithmetic on the flat arrays, no (ragged)
+# object array of token lists
+L = corpus.labels
 
-idx1 = l==1
-idx0 = l==0
-d1, l1 = d[idx1], l[idx1]
-d0, l0 = d[idx0], l[idx0] 
+by_class = corpus.split_by_class()
+c1, c0 = by_class[1], by_class[0]
 
-L = NP.array(l)
-
-assert d1.size == l1.size
-assert d0.size == l0.size
+assert len(c1) + len(c0) == len(corpus)
 
 
 # In[99]:
 
-q1 = NP.array([len(line) for line in d1])
-q0 = NP.array([len(line) for line in d0])
+q1 = c1.doc_lengths()
+q0 = c0.doc_lengths()
 
 print(round(q0.mean(), 2))
 print(round(q1.mean(), 2))
@@ -167,29 +134,26 @@ print(round(q1.mean(), 2))
 
 # In[100]:
 
-# look at the data by class
-w1 = [ word for line in d1 for word in line ]
-w0 = [ word for line in d0 for word in line ]
+# look at the data by class: count terms by class in one vectorized
+# pass over the encoded corpus (no flattened word lists)
+from term_counts import TermCounts
 
+tc = TermCounts.from_corpus(corpus)
 
-# In[101]:
 
-import collections as CL
-
-words1 = CL.defaultdict(int)
-words0 = CL.defaultdict(int)
-
-for word in w1:
-    words1[word] += 1
+# In[101]:
 
-for word in w0:
-    words0[word] += 1
+words1 = tc.term_counter(1)
+words0 = tc.term_counter(0)
 
 
 # In[102]:
 
-w1_freq = sorted(zip(words1.values(), words1.keys()), reverse=True)
-w0_freq = sorted(zip(words0.values(), words0.keys()), reverse=True)
+# (count, term) pairs for the 100 most frequent terms in each class;
+# partial selection rather than a sort of the whole vocabulary,
+# & ties are broken by term id rather than by comparing strings
+w1_freq = tc.top_k(1, 100)
+w0_freq = tc.top_k(0, 100)
 
 
 # In[103]:
@@ -205,39 +169,11 @@ v1.extend(v0)
 
 # In[104]:
 
-def build_feature_vector(data, feature_vector):
-    """
-    returns: a structured 2D data array comprised of in which
-        each column encodes one discrete feature; each row
-        represents one data instance
-    pass in: 
-        (i) the data: a nested list in which each list is one data instance,
-            or 'bag of words';
-        (ii) a template feature vector: a list of terms, comprising a subset
-            of the population whose frequency will be counted to to supply
-            the values comprising each feature vector 
-    this fn transforms a sequence of word bags (each bag is a python list)
-        into a structured 1D NumPy array of features
-    """
-    fv = set(feature_vector)
-    # maps each  most-frequent term to an offset in feature vector
-    term_vector_lut = { t:i for i, t in enumerate(fv) }
-    # remove all words from each line not in the feature_vector
-    d = (filter(lambda q: q in fv, line) for line in data)
-    d = deepcopy([list(line) for line in d])
-    # initialize the empty 2D NumPy array returned 
-    m, n = len(d), len(term_vector_lut)
-    D = NP.zeros((m, n))
-    dx = CL.defaultdict(int)
-    c = 0
-    for line in d:
-        new_row = NP.zeros(len(fv))
-        for w in line:
-            idx = term_vector_lut[w]
-            new_row[idx] += 1
-        D[c,:] = new_row
-        c += 1
-    return D
+# build_feature_vector fills the matrix w/o a per-row loop or per-row
+# allocation; pass sparse=True for a scipy.sparse CSR matrix & dtype=
+# to pick the value type; columns follow the order of the terms in the
+# feature vector
+from vectorize import build_feature_vector, CountVectorizer
 
 
 # In[105]:
@@ -250,12 +186,25 @@ v1.extend(v0)
 
 # In[106]:
 
-D = build_feature_vector(d, v1)
+# freeze the ordered vocabulary & persist it, so new descriptions can
+# be transformed at serving time into the same columns w/o a refit;
+# the tokenizer's config is saved too, & CountVectorizer.load(fp,
+# tokenize) raises if new text would be tokenized any other way
+vec = CountVectorizer().fit(v1, tokenize=tokenize)
+vec.save(os.path.join(PROJ_DIR, 'feature_vocab.json'))
+
+D = vec.transform(corpus)
 
 
 # In[107]:
 
-get_ipython().magic('timeit build_feature_vector(d, v1)')
+# dense vs sparse construction (python benchmarks.py vectorize runs the
+# same comparison on a synthetic corpus, including large feature vectors)
+from benchmarks import timed
+
+for name, args in (('dense', (corpus, v1)), ('sparse', (corpus, v1, True))):
+    t, X = timed(build_feature_vector, *args)
+    print("{0:<8}{1:>8.1f} ms".format(name, 1e3 * t))
 
 
 # In[108]:
@@ -264,8 +213,16 @@ get_ipython().magic('timeit build_feature_vector(d, v1)')
 # (if so, remove this feature--no predictive value and will caluse 
 # division by 0 when i attempt to mean center the data
 
-feature_val_sum = D.sum(axis=0)
-assert feature_val_sum.min() > 0
+# rather than assert, drop every constant column (empty ones included)
+# & refit the vocabulary to the columns kept, so the persisted
+# vocabulary still matches the columns of D
+from diagnostics import drop_zero_variance
+
+D, kept = drop_zero_variance(D)
+if kept.shape[0] < len(vec.terms):
+    print("dropped constant columns: {0}".format(sorted(set(vec.terms) - set(vec.terms[i] for i in kept))))
+    vec = CountVectorizer().fit([vec.terms[i] for i in kept], tokenize=tokenize)
+    vec.save(os.path.join(PROJ_DIR, 'feature_vocab.json'))
 
 
 # In[109]:
@@ -289,35 +246,58 @@ D0 = D[idx0,]
 
 
 
-# In[111]:
-
-dfs = os.path.join(PROJ_DIR, 'data_structured.csv')
-
-with open(dfs, 'w', encoding='utf-8') as fh:
-    writer = CSV.writer(fh, delimiter=',', quotechar='|', 
-                quoting=CSV.QUOTE_MINIMAL)
-    writer.writerows(D.tolist())
-
-
 # In[112]:
 
-def persist_structured_data(data, file_path):
+# binary, memory-mappable persistence: .npy arrays (CSR component
+# arrays if sparse) plus the labels & column terms, instead of every
+# float formatted as CSV text
+from matrix_io import save_matrix, load_matrix
+
+def persist_structured_data(data, file_path, labels=None, terms=None, vocab_version=None):
     """
-    returns: nothing, creates a file called 'data_structured.csv'
-        in the file_path passed in
+    returns: path of the directory 'data_structured' created in the
+        file_path passed in
     pass in: 
-        (i) 2D NumPy array
+        (i) 2D NumPy array or scipy.sparse matrix
         (ii) unix absolute file path
+        (iii) optional class labels, one per row, & column terms
+        (iv) optional version of the vectorizer that produced the
+            columns (eg, CountVectorizer.version), recorded in meta.json
     """
-    dfs = os.path.join(file_path, 'data_structured.csv')
-    with open(dfs, 'w', encoding='utf-8') as fh:
-        writer = CSV.writer(fh, delimiter=',', quotechar='|', quoting=CSV.QUOTE_MINIMAL)
-        writer.writerows(D.tolist())
+    dfs = os.path.join(file_path, 'data_structured')
+    return save_matrix(dfs, data, labels, terms, meta={'vocab_version': vocab_version})
 
 
 # In[113]:
 
-persist_structured_data(D, PROJ_DIR)
+dfs = persist_structured_data(D, PROJ_DIR, L, vec.terms, vocab_version=vec.version)
+
+# a training job maps the arrays w/o parsing or copying them:
+# D, L, info = load_matrix(dfs)
+
+
+# In[ ]:
+
+# for data that outgrows one file: an append-only store of fixed-size
+# shards (1M rows each) & a manifest of vocabulary version, row counts
+# & label counts; a new batch of descriptions is appended as new
+# shards rather than rewriting the matrix, & shards are read one at a
+# time (store.iter_shards) or in parallel (store.map_shards)
+from feature_store import FeatureStore
+
+# one store per vocabulary version: new columns start a new store
+# rather than mixing w/ (or being refused by) the old one
+store = FeatureStore(os.path.join(PROJ_DIR, 'feature_store-{0}'.format(vec.version)),
+                     vocab_version=vec.version, terms=vec.terms, shard_rows=2**20)
+
+# the store holds rows in data-file order; the corpus only grows by
+# appending, so the rows not yet stored are those whose file position
+# is past the last one stored (none, on a rerun over the same data)
+new = NP.flatnonzero(perm >= len(store))
+new = new[NP.argsort(perm[new])]
+store.append(D[new], L[new])
+
+print(len(store), store.n_shards, store.label_counts())
 
 
 ##### some simple analysis of the data to assess the general suitability of this data set for use in building a classifier
@@ -389,9 +369,12 @@ ax.grid(True)
 # In[133]:
 
 # by calculating the covariance matrix of the data matrix (matrix whose rows 
-# is comprised of feature vectors--just first 25 most frequent terms)
-D1 = D[:,:20]
-C = NP.corrcoef(D1, rowvar=0)
+# is comprised of feature vectors)--over every column: the correlations
+# come from the Gram matrix D^T D, a block of rows at a time
+from diagnostics import correlation_matrix, collinear_pairs
+
+D1 = D
+C = correlation_matrix(D1)
 C.shape
 
 # a correctly computed covariance matrix will have '1's down the main diagonal &
@@ -403,7 +386,11 @@ assert C.shape == (D1.shape[1], D1.shape[1])
 
 NP.set_printoptions(precision=2, suppress=True, linewidth=130)
 from pprint import pprint
-print(C)
+print(C[:20, :20])
+
+# highly collinear pairs of features, over all columns
+for r, (i, j) in collinear_pairs(D, threshold=.8):
+    print("{0:.2f}\t{1}\t{2}".format(r, vec.terms[i], vec.terms[j]))
 
 
 # fig = PLT.figure(figsize=(8, 6))
@@ -419,53 +406,19 @@ print(C)
 
 # In[134]:
 
-def standardize(data):
-    """
-    mean centers the data & scales it to unit variance
-    """
-    data_mean = data.mean(axis=0)
-    data_std = data.std(axis=0)
-    data -= data_mean
-    data /= data_std
-    return data
+# mean & variance are accumulated chunk by chunk (partial_fit) & saved,
+# so the same transform can be applied to new data at inference time;
+# pass with_mean=False to scale a sparse matrix w/o densifying it, &
+# dtype=NP.float32 to halve the memory of the result
+from scaling import StandardScaler
 
 
 # In[135]:
 
-def partition_data(data, class_labels, train_test_ratio=.9):
-    """
-    returns: data & class labels, split into training and test groups,
-        as 2 x 2-tuples; 
-        these 2 containers are suitable to pass to scikit-learn classifier
-        objects
-        to call their 'fit' method, pass in *tr; 
-        for 'predict', pass in te[0];
-        for 'score' pass in *te
-    pass in: 
-        data, 2D NumPy array
-        class labels, 1D NumPy array
-        train:test ratio: 0 < f < 1, default is 0.9
-    call this function bound to two variables, 
-        eg, train, test = partition_data()
-    """
-    # create a vector that holds the row indices
-    NP.random.seed(0)
-    idx = NP.random.permutation(data.shape[0])
-    # now order both data and class labels arrays by idx
-    D = data[idx,]
-    L = class_labels[idx]
-    # allocate the data to test & train partitions according to
-    # the train_test_ratio passed in
-    q = int(NP.ceil(train_test_ratio * D.shape[0]))
-    D_tr = D[:q,:]
-    D_te = D[q:,:]
-    L_tr = L[:q]
-    L_te = L[q:]
-    assert D_tr.shape[0] + D_te.shape[0] == D.shape[0]
-    assert L_tr.shape[0] + L_te.shape[0] == L.shape[0]
-    # 1D array required by scikit-learn
-    L_tr, L_te = NP.squeeze(L_tr), NP.squeeze(L_te)
-    return (D_tr, L_tr), (D_te, L_te)
+# partition_data permutes an index array only: data & labels are
+# gathered once into the two partitions, labels keep their dtype, and
+# the rng is explicit rather than NP.random.seed(0)
+from splits import partition_data
 
 
 # In[136]:
@@ -513,8 +466,10 @@ def fraction_correct(actual, predicted):
 
 # In[138]:
 
-# mean center the data & standardize to unit variance
-D = standardize(D)
+# mean center the data & standardize to unit variance (in place)
+scaler = StandardScaler().fit(D, chunk_size=2**14)
+scaler.save(os.path.join(PROJ_DIR, 'feature_scaler.npz'))
+D = scaler.transform(D, copy=False)
 
 # some assertion fixtures:
 mx = D.mean(axis=0)
@@ -529,19 +484,17 @@ NP.testing.assert_array_almost_equal(vx, vs, decimal=4)
 
 # In[139]:
 
-# shuffle the data
-L = L.reshape(-1, 1)
-DL = NP.hstack((D, L))
-idx = NP.random.permutation(NP.arange(D.shape[0]))
-DL = DL[idx,]
-
-D, L = NP.hsplit(DL, [-1])
+# no shuffle of D & L here: their rows are already in random order
+# (the corpus was shuffled in In[98]), & a second permute-and-gather
+# would only copy D again
 
 
 # In[140]:
 
 # partition the data into training & test sets
-tr, te = partition_data(D, L)
+# the rows are already shuffled: split in row order, so tr & te are
+# views of D rather than copies
+tr, te = partition_data(D, L, shuffle=False)
 
 
 #### IV. Build the Classifiers
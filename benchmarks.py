@@ -0,0 +1,465 @@
+# coding: utf-8
+
+"""
+micro-benchmarks for the pre-processing pipeline, run against a
+synthetic corpus so they need neither the scraped data nor NLTK
+
+usage: python benchmarks.py [name ...]   (no names runs them all)
+"""
+
+import sys
+import time
+import random
+import itertools as IT
+from copy import deepcopy
+
+
+def synthetic_corpus(n_lines=20000, words_per_line=60, vocab_size=20000, seed=0):
+    """
+    returns: (lines, stop_words) 2-tuple; lines is a list of raw strings,
+        stop_words is a list of the 150 most frequent synthetic terms
+    pass in: corpus dimensions & a random seed
+    term frequencies follow a Zipf distribution, like the real corpus
+    """
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocab = [''.join(rng.choice(letters) for _ in range(rng.randint(2, 10)))
+             for _ in range(vocab_size)]
+    cum_weights = list(IT.accumulate(1 / (r + 1) for r in range(vocab_size)))
+    lines = []
+    for _ in range(n_lines):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=words_per_line)
+        lines.append(' '.join(w.capitalize() if rng.random() < .1 else w
+                              for w in words) + '.\n')
+    return lines, vocab[:150]
+
+
+def timed(fn, *args, repeat=3):
+    """
+    returns: (best wall-clock time in seconds, result of the last call)
+    """
+    best, res = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, res
+
+
+def bench_tokenizer():
+    """
+    tokens/sec of the fused Tokenizer vs the chained generators &
+    deepcopies it replaces
+    """
+    from corpus_io import ptn_nwc_obj
+    from text_prep import Tokenizer, DOMAIN_STOP_WORDS, stem
+    lines, SW = synthetic_corpus()
+
+    def chained(lines):
+        d = (ptn_nwc_obj.sub('', line.strip().lower()).split() for line in lines)
+        d = (filter(lambda v: (v not in SW) & (len(v) > 4), line) for line in d)
+        d = deepcopy([list(line) for line in d])
+        d = (filter(lambda v: (v not in DOMAIN_STOP_WORDS), line) for line in d)
+        d = (list(map(stem, line)) for line in d)
+        return deepcopy([list(line) for line in d])
+
+    def fused(lines):
+        tokenize = Tokenizer(SW)
+        return [tokenize(line) for line in lines]
+
+    n_in = sum(len(line.split()) for line in lines)
+    t_chain, r_chain = timed(chained, lines)
+    t_fused, r_fused = timed(fused, lines)
+    assert r_chain == r_fused
+    print("{0:<12}{1:>14}".format('', 'tokens/sec'))
+    print("{0:<12}{1:>14,.0f}".format('chained', n_in / t_chain))
+    print("{0:<12}{1:>14,.0f}".format('fused', n_in / t_fused))
+    print("speedup: {0:.1f}x".format(t_chain / t_fused))
+
+
+def bench_stopwords():
+    """
+    per-token cost of the stop word & length check: two python lists
+    (the notebooks) vs one StopwordFilter hash set
+    """
+    from text_prep import StopwordFilter, DOMAIN_STOP_WORDS
+    lines, SW = synthetic_corpus(n_lines=5000)
+    batch = [line.lower().split() for line in lines]
+    n_tok = sum(len(tokens) for tokens in batch)
+
+    def lists(batch):
+        return [[v for v in tokens if (v not in SW) & (len(v) > 4)
+                 and v not in DOMAIN_STOP_WORDS] for tokens in batch]
+
+    sw_filter = StopwordFilter(SW)
+    t_list, r_list = timed(lists, batch)
+    t_set, r_set = timed(sw_filter.filter_batch, batch)
+    assert r_list == r_set
+    print("{0:<16}{1:>14}".format('', 'ns/token'))
+    print("{0:<16}{1:>14.1f}".format('list scan', 1e9 * t_list / n_tok))
+    print("{0:<16}{1:>14.1f}".format('StopwordFilter', 1e9 * t_set / n_tok))
+
+
+def bench_stemmers():
+    """
+    per-token cost of each stemmer, w/ & w/o the LRU cache, over the
+    Zipfian token stream the tokenizer hands it
+    """
+    from text_prep import SuffixStemmer, PorterStemmer, CachedStemmer, StopwordFilter
+    lines, SW = synthetic_corpus()
+    tokens = [t for toks in StopwordFilter(SW).filter_batch(
+        line.lower().split() for line in lines) for t in toks]
+
+    def run(stemmer):
+        return [stemmer(t) for t in tokens]
+
+    print("{0:<18}{1:>12}{2:>12}".format('', 'ns/token', 'hit rate'))
+    for name, stemmer in (('suffix', SuffixStemmer()),
+                          ('porter', PorterStemmer()),
+                          ('cached suffix', CachedStemmer(SuffixStemmer())),
+                          ('cached porter', CachedStemmer(PorterStemmer()))):
+        t, _ = timed(run, stemmer, repeat=1)
+        hr = stemmer.hit_rate if isinstance(stemmer, CachedStemmer) else float('nan')
+        print("{0:<18}{1:>12.1f}{2:>12.3f}".format(name, 1e9 * t / len(tokens), hr))
+
+
+def bench_parallel(max_workers=None):
+    """
+    lines/sec of read_corpus_parallel as the worker count doubles from
+    1 up to os.cpu_count(), against the single-process read_corpus
+    """
+    import os
+    import tempfile
+    from corpus_io import read_corpus, read_corpus_parallel
+    from text_prep import Tokenizer, CachedStemmer, SuffixStemmer
+    lines, SW = synthetic_corpus(n_lines=100000)
+    tokenize = Tokenizer(SW, stemmer=CachedStemmer(SuffixStemmer()))
+    max_workers = max_workers or os.cpu_count()
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, 'data.txt')
+        labels_file = os.path.join(tmp, 'class_labels.txt')
+        with open(data_file, 'w', encoding='utf-8') as fh:
+            fh.writelines(lines)
+        with open(labels_file, 'w', encoding='utf-8') as fh:
+            fh.writelines('{0}\n'.format(i % 2) for i in range(len(lines)))
+        t, ref = timed(lambda: list(read_corpus(data_file, labels_file, tokenize)), repeat=1)
+        print("{0:<12}{1:>14}{2:>10}".format('workers', 'lines/sec', 'speedup'))
+        print("{0:<12}{1:>14,.0f}{2:>10}".format('serial', len(lines) / t, '1.0'))
+        n = 1
+        while n <= max_workers:
+            tn, res = timed(lambda: list(read_corpus_parallel(
+                data_file, labels_file, tokenize, n_workers=n, chunk_size=2**20)), repeat=1)
+            assert res == ref
+            print("{0:<12}{1:>14,.0f}{2:>10.1f}".format(n, len(lines) / tn, t / tn))
+            n *= 2
+
+
+def bench_sketch():
+    """
+    top-100 accuracy & memory of ApproxTermCounter vs the exact
+    per-class dict, over a range of sketch sizes
+    """
+    import sys
+    from sketch import ApproxTermCounter
+    from term_counts import term_counter, top_k_dict
+    lines, _ = synthetic_corpus(n_lines=20000, words_per_line=40, vocab_size=200000)
+    docs = [line.lower().rstrip('.\n').split() for line in lines]
+    pairs = [(doc, i % 2) for i, doc in enumerate(docs)]
+    exact = term_counter(t for doc, c in pairs if c == 1 for t in doc)
+    exact_bytes = sys.getsizeof(exact) + sum(sys.getsizeof(t) + 28 for t in exact)
+    ref = top_k_dict(exact, 100)
+    ref_terms = {t for _, t in ref}
+    print("exact: {0:,} terms, ~{1:,} bytes".format(len(exact), exact_bytes))
+    print("{0:>8}{1:>10}{2:>14}{3:>10}{4:>12}{5:>14}".format(
+        'width', 'capacity', 'bytes/class', 'recall', 'max rel err', 'bound (eps*N)'))
+    for width, capacity in ((2**10, 200), (2**12, 500), (2**14, 1000), (2**16, 2000)):
+        atc = ApproxTermCounter(width=width, depth=4, capacity=capacity)
+        atc.add_stream(pairs)
+        top = atc.top_k(1, 100)
+        recall = len(ref_terms & {t for _, t in top}) / len(ref_terms)
+        rel = max(abs(c - exact[t]) / exact[t] for c, t in top)
+        bound = atc.error_bounds(1)['cms_overcount']
+        print("{0:>8}{1:>10}{2:>14,}{3:>10.2f}{4:>12.3f}{5:>14,.0f}".format(
+            width, capacity, atc.nbytes() // 2, recall, rel, bound))
+
+
+def bench_vectorize():
+    """
+    build_feature_vector: the notebooks' per-row loop vs the dense &
+    sparse paths, for a small & a large feature vector
+    """
+    import collections as CL
+    import numpy as NP
+    from encoded_corpus import EncodedCorpus
+    from vectorize import build_feature_vector
+
+    def per_row_loop(data, feature_vector):
+        fv = set(feature_vector)
+        term_vector_lut = {t: i for i, t in enumerate(fv)}
+        d = (filter(lambda q: q in fv, line) for line in data)
+        d = deepcopy([list(line) for line in d])
+        D = NP.zeros((len(d), len(term_vector_lut)))
+        for c, line in enumerate(d):
+            new_row = NP.zeros(len(fv))
+            for w in line:
+                new_row[term_vector_lut[w]] += 1
+            D[c, :] = new_row
+        return D
+
+    lines, _ = synthetic_corpus(n_lines=20000, words_per_line=40)
+    docs = [line.lower().rstrip('.\n').split() for line in lines]
+    corpus = EncodedCorpus.from_documents(docs, [0] * len(docs))
+    freq = CL.Counter(t for doc in docs for t in doc)
+    print("{0:<10}{1:<22}{2:>10}{3:>14}".format('features', 'path', 'ms', 'bytes'))
+    for n in (100, 5000):
+        fv = [t for t, _ in freq.most_common(n)]
+        runs = (('per-row loop', lambda: per_row_loop(docs, fv)),
+                ('dense, lists', lambda: build_feature_vector(docs, fv)),
+                ('dense, encoded', lambda: build_feature_vector(corpus, fv)),
+                ('sparse, encoded', lambda: build_feature_vector(corpus, fv, sparse=True,
+                                                                dtype=NP.float32)))
+        for name, fn in runs:
+            t, X = timed(fn, repeat=1 if name == 'per-row loop' else 3)
+            nbytes = X.nbytes if isinstance(X, NP.ndarray) else \
+                X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+            print("{0:<10}{1:<22}{2:>10.1f}{3:>14,}".format(n, name, 1e3 * t, nbytes))
+
+
+def bench_incidence():
+    """
+    co-occurrence counts for the 25 x 25 top-term pairs: the notebooks'
+    bool columns & NP.sum vs packed words & popcount
+    """
+    import numpy as NP
+    from incidence import BitIncidence, popcount
+
+    rng = NP.random.default_rng(0)
+    D = rng.poisson(.05, size=(20000, 5000))
+    Db = NP.array(NP.where(D > 0, 1, 0), dtype=bool)
+    B = BitIncidence.from_dense(D)
+    pairs = list(IT.combinations(range(25), 2))
+    DT, W = Db.T[:25].copy(), B.words[:25]
+    t_bool, c_bool = timed(lambda: [NP.sum(DT[i] & DT[j]) for i, j in pairs])
+    t_bits, c_bits = timed(lambda: [popcount(W[i] & W[j]).sum() for i, j in pairs])
+    assert c_bool == c_bits
+    print("{0:<14}{1:>10}{2:>14}".format('layout', 'ms', 'bytes'))
+    print("{0:<14}{1:>10.2f}{2:>14,}".format('bool', 1e3 * t_bool, Db.nbytes))
+    print("{0:<14}{1:>10.2f}{2:>14,}".format('bit-packed', 1e3 * t_bits, B.nbytes))
+
+
+def bench_cooccurrence():
+    """
+    top co-occurring pairs: the notebooks' per-pair loop over the top 25
+    terms vs one blocked sparse product, for 25 & for all 5000 terms
+    """
+    import numpy as NP
+    from cooccurrence import incidence_csr, top_pairs
+
+    rng = NP.random.default_rng(0)
+    D = rng.poisson(.01, size=(20000, 5000))
+    Db = NP.array(D > 0, dtype=bool)
+    DT = Db.T[:25]
+    X = incidence_csr(D)
+
+    def per_pair_loop():
+        C = [(NP.sum(DT[i] & DT[j]), (i, j)) for i, j in IT.combinations(range(25), 2)]
+        return sorted(C, reverse=True)
+
+    runs = (('per-pair loop, 25', per_pair_loop),
+            ('X^T X, 25', lambda: top_pairs(X, k=300, cols=range(25))),
+            ('X^T X, 5000', lambda: top_pairs(X, k=300)),
+            ('X^T X, 5000, pmi', lambda: top_pairs(X, k=300, score='pmi', min_count=5)))
+    print("{0:<22}{1:>10}".format('path', 'ms'))
+    for name, fn in runs:
+        t, _ = timed(fn)
+        print("{0:<22}{1:>10.1f}".format(name, 1e3 * t))
+
+
+def bench_pairs():
+    """
+    PairVectorizer: unigram + bigram + co-occurring pair columns, from
+    an EncodedCorpus & from lists, vs unigram columns alone
+    """
+    import collections as CL
+    import numpy as NP
+    from encoded_corpus import EncodedCorpus
+    from vectorize import CountVectorizer, PairVectorizer
+
+    lines, _ = synthetic_corpus(n_lines=20000, words_per_line=40)
+    docs = [line.lower().rstrip('.\n').split() for line in lines]
+    corpus = EncodedCorpus.from_documents(docs, [0] * len(docs))
+    fv = [t for t, _ in CL.Counter(t for doc in docs for t in doc).most_common(100)]
+    pairs = list(IT.combinations(fv[:25], 2))
+    pvec = PairVectorizer(max_bigrams=1000).fit(corpus, fv, pairs=pairs, min_count=20)
+    runs = (('unigrams, encoded', lambda: CountVectorizer(sparse=True).fit(fv).transform(corpus)),
+            ('fit pairs, encoded', lambda: PairVectorizer(max_bigrams=1000).fit(
+                corpus, fv, pairs=pairs, min_count=20)),
+            ('pairs, encoded', lambda: pvec.transform(corpus)),
+            ('pairs, lists', lambda: pvec.transform(docs)))
+    print("{0:<22}{1:>10}{2:>10}{3:>14}".format('path', 'ms', 'columns', 'bytes'))
+    for name, fn in runs:
+        t, X = timed(fn)
+        if isinstance(X, PairVectorizer):
+            print("{0:<22}{1:>10.1f}{2:>10}".format(name, 1e3 * t, X.n_features))
+            continue
+        nbytes = X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+        print("{0:<22}{1:>10.1f}{2:>10}{3:>14,}".format(name, 1e3 * t, X.shape[1], nbytes))
+
+
+def bench_weighting():
+    """
+    class-ratio weights for every term: the notebooks' dict lookups vs
+    one vectorized pass; then applying weights to a dense vs CSR matrix
+    """
+    import numpy as NP
+    from scipy import sparse as SPS
+    from encoded_corpus import EncodedCorpus
+    from term_counts import TermCounts
+    from vectorize import CountVectorizer
+    from weighting import class_ratio_weights, idf_weights, column_weights, scale_columns, tfidf
+
+    lines, _ = synthetic_corpus(n_lines=20000, words_per_line=40)
+    docs = [line.lower().rstrip('.\n').split() for line in lines]
+    labels = [i % 2 for i in range(len(docs))]
+    corpus = EncodedCorpus.from_documents(docs, labels)
+    tc = TermCounts.from_corpus(corpus)
+    tc1, tc0 = tc.term_counter(1), tc.term_counter(0)
+    terms = [t for _, t in tc.top_k(1, 5000)]
+
+    def dict_loop():
+        return [tc1[t] / (tc0[t] + 1) for t in terms]
+
+    vec = CountVectorizer(sparse=True).fit(terms)
+    X = vec.transform(corpus)
+    D = X.toarray()
+    w = column_weights(class_ratio_weights(tc, 1), tc.vocab, vec.terms)
+    idf = column_weights(idf_weights(tc), tc.vocab, vec.terms)
+    runs = (('weights, dict loop', dict_loop),
+            ('weights, vectorized', lambda: class_ratio_weights(tc, 1)),
+            ('scale, dense', lambda: scale_columns(D, w)),
+            ('scale, CSR', lambda: scale_columns(X, w)),
+            ('tf-idf, CSR', lambda: tfidf(X, idf)))
+    print("{0:<22}{1:>10}".format('path', 'ms'))
+    for name, fn in runs:
+        t, _ = timed(fn)
+        print("{0:<22}{1:>10.2f}".format(name, 1e3 * t))
+
+
+def bench_scaling():
+    """
+    the notebooks' standardize (whole matrix at once) vs StandardScaler
+    fit in chunks, dense & float32, & scale-only on a CSR matrix
+    """
+    import numpy as NP
+    from scipy import sparse as SPS
+    from scaling import StandardScaler
+
+    def standardize(data):
+        data = data.copy()
+        data -= data.mean(axis=0)
+        data /= data.std(axis=0)
+        return data
+
+    X = SPS.random(20000, 5000, density=.01, format='csr', random_state=0, dtype=NP.float64)
+    D = X.toarray()
+    runs = (('standardize, dense', lambda: standardize(D)),
+            ('scaler, dense', lambda: StandardScaler().fit(D).transform(D)),
+            ('scaler, float32', lambda: StandardScaler(dtype=NP.float32).fit(D).transform(D)),
+            ('scale-only, CSR', lambda: StandardScaler(with_mean=False).fit(X).transform(X)))
+    print("{0:<22}{1:>10}{2:>14}".format('path', 'ms', 'bytes out'))
+    for name, fn in runs:
+        t, Y = timed(fn)
+        nbytes = Y.nbytes if isinstance(Y, NP.ndarray) else \
+            Y.data.nbytes + Y.indices.nbytes + Y.indptr.nbytes
+        print("{0:<22}{1:>10.1f}{2:>14,}".format(name, 1e3 * t, nbytes))
+
+
+def bench_persist():
+    """
+    persisting the data matrix: the notebooks' CSV rows vs .npy (dense)
+    & CSR component arrays, each written then loaded back
+    """
+    import os
+    import csv as CSV
+    import shutil
+    import tempfile
+    import numpy as NP
+    from scipy import sparse as SPS
+    from matrix_io import save_matrix, load_matrix
+
+    X = SPS.random(20000, 1000, density=.02, format='csr', random_state=0, dtype=NP.float64)
+    D = X.toarray()
+    tmp = tempfile.mkdtemp()
+
+    def write_csv():
+        with open(os.path.join(tmp, 'd.csv'), 'w', encoding='utf-8') as fh:
+            CSV.writer(fh, delimiter=',', quotechar='|', quoting=CSV.QUOTE_MINIMAL).writerows(D.tolist())
+
+    def read_csv():
+        with open(os.path.join(tmp, 'd.csv'), encoding='utf-8') as fh:
+            return NP.array([[float(v) for v in row] for row in CSV.reader(fh, quotechar='|')])
+
+    def size(path):
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+    runs = (('csv', write_csv, read_csv, 'd.csv'),
+            ('npy, dense', lambda: save_matrix(os.path.join(tmp, 'dense'), D),
+             lambda: load_matrix(os.path.join(tmp, 'dense'))[0], 'dense'),
+            ('npy, csr', lambda: save_matrix(os.path.join(tmp, 'csr'), X),
+             lambda: load_matrix(os.path.join(tmp, 'csr'))[0], 'csr'))
+    print("{0:<14}{1:>12}{2:>12}{3:>14}".format('format', 'write ms', 'load ms', 'bytes'))
+    try:
+        for name, write, read, path in runs:
+            t_w, _ = timed(write, repeat=1)
+            t_r, _ = timed(read, repeat=1)
+            print("{0:<14}{1:>12.1f}{2:>12.1f}{3:>14,}".format(
+                name, 1e3 * t_w, 1e3 * t_r, size(os.path.join(tmp, path))))
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_correlation():
+    """
+    feature correlation over every column: NP.corrcoef on the dense
+    matrix vs blocked correlation from the sparse Gram matrix
+    """
+    import numpy as NP
+    from scipy import sparse as SPS
+    from diagnostics import correlation_matrix, collinear_pairs
+
+    X = SPS.random(20000, 2000, density=.01, format='csr', random_state=0, dtype=NP.float64)
+    D = X.toarray()
+    runs = (('corrcoef, dense', lambda: NP.corrcoef(D, rowvar=0)),
+            ('gram, dense', lambda: correlation_matrix(D, block=256)),
+            ('gram, CSR', lambda: correlation_matrix(X, block=256)),
+            ('collinear, CSR', lambda: collinear_pairs(X, .5, block=256)))
+    print("{0:<22}{1:>10}".format('path', 'ms'))
+    for name, fn in runs:
+        t, _ = timed(fn)
+        print("{0:<22}{1:>10.1f}".format(name, 1e3 * t))
+
+
+BENCHMARKS = {
+    'tokenizer': bench_tokenizer,
+    'stopwords': bench_stopwords,
+    'stemmers': bench_stemmers,
+    'parallel': bench_parallel,
+    'sketch': bench_sketch,
+    'vectorize': bench_vectorize,
+    'incidence': bench_incidence,
+    'cooccurrence': bench_cooccurrence,
+    'pairs': bench_pairs,
+    'weighting': bench_weighting,
+    'scaling': bench_scaling,
+    'persist': bench_persist,
+    'correlation': bench_correlation,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print("\n== {0} ==".format(name))
+        BENCHMARKS[name]()
@@ -0,0 +1,133 @@
+# coding: utf-8
+
+"""
+term co-occurrence over documents as one sparse product, X^T X, on the
+(documents x terms) incidence matrix: entry (i, j) is the number of
+documents containing both term i & term j, the diagonal is each term's
+document frequency
+"""
+
+import numpy as NP
+from scipy import sparse as SPS
+
+from incidence import BitIncidence
+
+
+SCORES = ('count', 'pmi', 'lift', 'jaccard')
+
+
+def incidence_csr(X):
+    """
+    returns: (documents x terms) scipy.sparse CSR matrix of int32 1s,
+        one per (document, term) w/ a positive value
+    pass in: dense array, scipy.sparse matrix or BitIncidence
+    """
+    if isinstance(X, BitIncidence):
+        X = X.to_sparse()
+    X = SPS.csr_matrix(X, copy=True)
+    X.sum_duplicates()
+    X.data = (X.data > 0).astype(NP.int32)
+    X.eliminate_zeros()
+    return X
+
+
+def cooccurrence_matrix(X, cols=None, block=2**12):
+    """
+    returns: (n x n) scipy.sparse CSR int32 matrix of document
+        co-occurrence counts, symmetric, w/ document frequencies on the
+        diagonal
+    pass in:
+        (i) the data: dense array, scipy.sparse matrix or BitIncidence;
+        (ii) optional sequence of column offsets to restrict to (n of
+            them), default is every column;
+        (iii) number of columns multiplied per block
+    """
+    X = incidence_csr(X)
+    if cols is not None:
+        X = X[:, cols]
+    XT, Xc = X.T.tocsr(), X.tocsc()
+    n = X.shape[1]
+    if not n:
+        return SPS.csr_matrix((0, 0), dtype=NP.int32)
+    return SPS.hstack([XT @ Xc[:, a:a + block] for a in range(0, n, block)], format='csr')
+
+
+def _score(score, n, df_i, df_j, N):
+    if score == 'count':
+        return n
+    if score == 'jaccard':
+        return n / (df_i + df_j - n)
+    # observed / expected co-occurrence under independence
+    lift = n * N / (df_i * df_j)
+    return NP.log(lift) if score == 'pmi' else lift
+
+
+def _select(s, n, i, j, k):
+    # keep the k best by score, ties broken by count, then pair; every
+    # candidate tied w/ the k-th score is kept, as count breaks the tie
+    if s.shape[0] > k:
+        kth = NP.partition(-s, k - 1)[k - 1]
+        keep = -s <= kth
+        s, n, i, j = s[keep], n[keep], i[keep], j[keep]
+    order = NP.lexsort((j, i, -n, -s))[:k]
+    return s[order], n[order], i[order], j[order]
+
+
+def top_pairs(X, k=100, score='count', min_count=1, cols=None, block=2**12):
+    """
+    returns: python list of (score, count, (i, j)) 3-tuples, score
+        descending; i & j are the column offsets of a term pair, i first
+        in column (or cols) order
+    pass in:
+        (i) the data: dense array, scipy.sparse matrix or BitIncidence;
+        (ii) k, the number of pairs returned;
+        (iii) score: 'count' (documents containing both terms), 'pmi'
+            (log of lift), 'lift' (observed / expected co-occurrence,
+            N * n_ij / (n_i * n_j)) or 'jaccard' (n_ij / (n_i + n_j - n_ij));
+        (iv) min_count, pairs co-occurring in fewer documents are
+            skipped (PMI & lift overrate rare pairs);
+        (v) optional sequence of column offsets to restrict to; the
+            offsets returned are still those of X;
+        (vi) number of columns multiplied per block
+    X^T X is formed block columns at a time, only the upper triangle, &
+        reduced to its top k before the next block, so memory is bounded
+        by the block, not by the square of the vocabulary
+    """
+    assert score in SCORES, "score must be one of {0}".format(SCORES)
+    X = incidence_csr(X)
+    ids = NP.arange(X.shape[1]) if cols is None else NP.asarray(cols, dtype=NP.int64)
+    if cols is not None:
+        X = X[:, ids]
+    N, V = X.shape
+    df = NP.asarray(X.sum(axis=0), dtype=NP.int64).ravel()
+    XT, Xc = X.T.tocsr(), X.tocsc()
+    fdt = NP.int64 if score == 'count' else NP.float64
+    best = (NP.zeros(0, dtype=fdt),) + tuple(NP.zeros(0, dtype=NP.int64) for _ in range(3))
+    for a in range(0, V, block):
+        b = min(a + block, V)
+        # rows past b only hold pairs w/ i > j, so leave them out
+        G = (XT[:b] @ Xc[:, a:b]).tocoo()
+        i, j, n = G.row.astype(NP.int64), G.col.astype(NP.int64) + a, G.data.astype(NP.int64)
+        keep = (i < j) & (n >= max(min_count, 1))
+        i, j, n = i[keep], j[keep], n[keep]
+        s = _score(score, n, df[i], df[j], N)
+        best = _select(*(NP.concatenate(z) for z in zip(best, (s, n, i, j))), k)
+    s, n, i, j = best
+    return [(sc, c, (a, b)) for sc, c, a, b in
+            zip(s.tolist(), n.tolist(), ids[i].tolist(), ids[j].tolist())]
+
+
+def top_pairs_by_class(X, labels, classes=None, **kwargs):
+    """
+    returns: dict mapping each class label to its top_pairs list, scored
+        over that class' documents only
+    pass in: the data (as for top_pairs), 1D array of class labels, one
+        per row, optional sequence of classes (default is every label
+        present) & any keyword arguments of top_pairs
+    """
+    labels = NP.asarray(labels)
+    classes = NP.unique(labels).tolist() if classes is None else classes
+    if isinstance(X, BitIncidence):
+        return {c: top_pairs(X.select_docs(labels == c), **kwargs) for c in classes}
+    X = incidence_csr(X)
+    return {c: top_pairs(X[labels == c], **kwargs) for c in classes}
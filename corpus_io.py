@@ -0,0 +1,288 @@
+# coding: utf-8
+
+"""
+streaming access to the raw corpus: 'data.txt' holds one app description
+per line, 'class_labels.txt' holds the matching integer class label on
+the same line number
+"""
+
+import os
+import json
+import re
+import collections as CL
+import itertools as IT
+import multiprocessing as MP
+import mmap
+
+import numpy as NP
+
+
+ptn_nwc = "[!#$%&'*+/=?`{|}~^.-]"
+ptn_nwc_obj = re.compile(ptn_nwc, re.MULTILINE)
+
+
+def normalize(line):
+    """
+    returns: python list of tokens
+    pass in: one raw line of text
+    lower cases the line, strips end-of-line whitespace, removes
+        punctuation & splits on whitespace (same normalization
+        used in the notebooks)
+    """
+    return ptn_nwc_obj.sub('', line.strip().lower()).split()
+
+
+def read_corpus(data_file, labels_file, tokenize=normalize, encoding='utf-8'):
+    """
+    returns: generator of (tokens, label) 2-tuples, one per line
+    pass in:
+        (i) absolute path to the data file (one instance per line);
+        (ii) absolute path to the class labels file (one int per line);
+        (iii) callable that maps one raw line to a python list of tokens,
+            default is 'normalize'
+    the two files are read in lockstep, one line at a time, so memory
+        use is bounded by the longest line rather than by the corpus;
+        raises ValueError as soon as one file runs out before the other;
+        lines end at '\n' only (a lone '\r' stays inside its line)
+    """
+    missing = object()
+    # newline='\n': lines end at '\n' only, as in read_chunk, LineIndex &
+    # incremental, so a stray '\r' inside a description can't split it
+    with open(data_file, mode='r', encoding=encoding, newline='\n') as fh_d, \
+            open(labels_file, mode='r', encoding=encoding, newline='\n') as fh_l:
+        pairs = IT.zip_longest(fh_d, fh_l, fillvalue=missing)
+        for i, (line, label) in enumerate(pairs, start=1):
+            if line is missing or label is missing:
+                short = data_file if line is missing else labels_file
+                raise ValueError(
+                    "data & labels files differ in length: "
+                    "{0} ends before line {1}".format(short, i))
+            yield tokenize(line), int(label.strip())
+
+
+def line_chunks(file_path, chunk_size=2**24):
+    """
+    returns: list of (start, end) byte offsets that cover the file;
+        every boundary falls just after a newline, so no line is split
+    pass in:
+        (i) absolute path to the data file;
+        (ii) target chunk size in bytes, default is 16 MB
+    """
+    size = os.path.getsize(file_path)
+    bounds = [0]
+    with open(file_path, mode='rb') as fh:
+        while bounds[-1] < size:
+            fh.seek(min(bounds[-1] + chunk_size, size))
+            fh.readline()
+            bounds.append(min(fh.tell(), size))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+_worker_tokenize = None
+
+
+def _init_worker(tokenize):
+    global _worker_tokenize
+    _worker_tokenize = tokenize
+
+
+def read_chunk(file_path, start, end, encoding='utf-8'):
+    """
+    returns: python list of the lines in bytes [start, end) of the file
+    pass in: file path & one (start, end) pair from line_chunks
+    """
+    with open(file_path, mode='rb') as fh:
+        fh.seek(start)
+        buf = fh.read(end - start)
+    lines = buf.decode(encoding).split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def _tokenize_chunk(args):
+    return [_worker_tokenize(line) for line in read_chunk(*args)]
+
+
+def read_corpus_parallel(data_file, labels_file, tokenize=normalize,
+                         n_workers=None, chunk_size=2**24, encoding='utf-8'):
+    """
+    returns: generator of (tokens, label) 2-tuples, one per line, in
+        file order--the same stream read_corpus returns
+    pass in:
+        (i) absolute path to the data file;
+        (ii) absolute path to the class labels file;
+        (iii) callable that maps one raw line to a list of tokens; it is
+            pickled once to each worker, so it must be picklable;
+        (iv) number of worker processes, default is os.cpu_count();
+        (v) chunk size in bytes, default is 16 MB
+    the data file is split into line-aligned byte ranges that a process
+        pool tokenizes concurrently; at most 2 chunks per worker are in
+        flight, & results are paired w/ the labels file as each chunk
+        comes back, so memory stays bounded; raises ValueError if the
+        two files differ in length
+    """
+    n_workers = n_workers or os.cpu_count()
+    tasks = ((data_file, start, end, encoding)
+             for start, end in line_chunks(data_file, chunk_size))
+    with MP.Pool(n_workers, initializer=_init_worker, initargs=(tokenize,)) as pool, \
+            open(labels_file, mode='r', encoding=encoding, newline='\n') as fh_l:
+        pending = CL.deque(pool.apply_async(_tokenize_chunk, (t,))
+                           for t in IT.islice(tasks, 2 * n_workers))
+        i = 0
+        while pending:
+            chunk = pending.popleft().get()
+            for t in IT.islice(tasks, 1):
+                pending.append(pool.apply_async(_tokenize_chunk, (t,)))
+            for tokens in chunk:
+                i += 1
+                label = fh_l.readline()
+                if not label:
+                    raise ValueError(
+                        "data & labels files differ in length: "
+                        "{0} ends before line {1}".format(labels_file, i))
+                yield tokens, int(label.strip())
+        if fh_l.readline():
+            raise ValueError(
+                "data & labels files differ in length: "
+                "{0} ends before line {1}".format(data_file, i + 1))
+
+
+def fingerprint(file_path):
+    """
+    returns: dict identifying one version of an input file
+    pass in: absolute file path
+    (path, size & mtime rather than a content hash, so fingerprinting a
+        multi-GB file costs one stat call)
+    """
+    st = os.stat(file_path)
+    return {'path': os.path.abspath(file_path), 'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns}
+
+
+def _index_meta_path(index_file):
+    return os.path.splitext(index_file)[0] + '.json'
+
+
+def build_line_index(data_file, index_file=None, block_size=2**24):
+    """
+    returns: path to the index file written
+    pass in:
+        (i) absolute path to the data file;
+        (ii) path to write the index to, default is the data file's
+            path + '.idx.npy', ie, stored alongside it
+        (iii) bytes scanned per block, default is 16 MB
+    the index is a 1D int64 NumPy array of n + 1 byte offsets: line i
+        spans [offsets[i], offsets[i+1]); the data file's fingerprint
+        (size & mtime) as of the scan is written alongside it, in
+        '<index>.json', which LineIndex uses to detect a stale index
+    """
+    index_file = index_file or data_file + '.idx.npy'
+    # taken before the scan: a write during it makes the index stale
+    fp = fingerprint(data_file)
+    offsets, pos = [NP.zeros(1, dtype=NP.int64)], 0
+    with open(data_file, mode='rb') as fh:
+        while True:
+            buf = fh.read(block_size)
+            if not buf:
+                break
+            nl = NP.flatnonzero(NP.frombuffer(buf, dtype=NP.uint8) == 10)
+            offsets.append(nl.astype(NP.int64) + pos + 1)
+            pos += len(buf)
+    offsets = NP.concatenate(offsets)
+    if offsets[-1] != pos:
+        # last line has no trailing newline
+        offsets = NP.append(offsets, pos)
+    NP.save(index_file, offsets)
+    # written last: an index w/o it is rebuilt
+    with open(_index_meta_path(index_file), 'w', encoding='utf-8') as fh:
+        json.dump(fp, fh)
+    return index_file
+
+
+def load_labels(labels_file, encoding='utf-8'):
+    """
+    returns: 1D NumPy array of dtype 'int8', one class label per line
+    pass in: absolute path to the class labels file
+    """
+    with open(labels_file, mode='r', encoding=encoding, newline='\n') as fh:
+        return NP.fromiter((int(line) for line in fh), dtype=NP.int8)
+
+
+class LineIndex:
+    """
+    random access to the lines of the data file w/o loading it: the file
+    is memory-mapped & the offset index (see build_line_index) is loaded
+    w/ mmap_mode='r', so fetching line i touches only that line's pages
+
+    pass in:
+        data_file: absolute path to the data file
+        index_file: path to its index, default is data_file + '.idx.npy';
+            (re)built if missing or stale
+        tokenize: callable applied to each line fetched, default is
+            'normalize'; pass None to get the raw lines
+    """
+
+    def __init__(self, data_file, index_file=None, tokenize=normalize,
+                 encoding='utf-8'):
+        self.data_file = data_file
+        self.index_file = index_file or data_file + '.idx.npy'
+        self.tokenize = tokenize
+        self.encoding = encoding
+        # stale unless the data file's size & mtime match those recorded
+        # when the index was built: an equal size alone misses rewrites
+        meta = _index_meta_path(self.index_file)
+        stale = True
+        if os.path.exists(self.index_file) and os.path.exists(meta):
+            with open(meta, encoding='utf-8') as fh:
+                stale = json.load(fh) != fingerprint(data_file)
+        if stale:
+            build_line_index(data_file, self.index_file)
+        self.offsets = NP.load(self.index_file, mmap_mode='r')
+        self._fh = open(data_file, mode='rb')
+        # mmap refuses zero-length files
+        size = os.fstat(self._fh.fileno()).st_size
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("line index out of range")
+        line = self._mm[self.offsets[i]:self.offsets[i + 1]].decode(self.encoding)
+        return self.tokenize(line) if self.tokenize else line
+
+    def take(self, indices):
+        """
+        returns: python list of lines (tokenized, unless tokenize is None)
+        pass in: sequence of line numbers, eg, a slice of a permutation
+        """
+        return [self[i] for i in indices]
+
+    def iter_batches(self, order, batch_size=1024):
+        """
+        returns: generator of (indices, lines) 2-tuples
+        pass in:
+            (i) 1D array of line numbers giving the visiting order, eg,
+                rng.permutation(len(index)) for one shuffled epoch, or the
+                train/test indices of a split
+            (ii) lines per batch
+        """
+        for k in range(0, len(order), batch_size):
+            idx = order[k:k + batch_size]
+            yield idx, self.take(idx)
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
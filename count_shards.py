@@ -0,0 +1,289 @@
+# coding: utf-8
+
+"""
+mergeable per-class term counts for map-reduce: each worker or machine
+counts its own shard of the corpus into a CountTable & saves it; tables
+add together (a + b is the merge), & merge_shards reduces any number of
+saved shards in one streaming pass w/ bounded memory
+
+a saved shard is a directory of raw, memory-mappable files:
+    meta.json       class labels & number of terms
+    terms.bin       the terms, utf-8, concatenated in sorted order
+    offsets.i64     n_terms + 1 byte offsets into terms.bin
+    counts.i64      (n_terms x num_classes) int64 counts, row-major
+"""
+
+import os
+import json
+import heapq
+import collections as CL
+
+import numpy as NP
+
+from term_counts import top_k_ids
+
+
+class CountTable:
+    """
+    per-class term counts keyed by term (not term id), so tables built
+    over different vocabularies can be merged
+
+    pass in:
+        terms: sequence of distinct terms, sorted ascending
+        counts: (n_terms x num_classes) int64 array
+        classes: sequence of class labels, one per column
+    """
+
+    def __init__(self, terms, counts, classes):
+        self.terms = list(terms)
+        self.counts = NP.asarray(counts, dtype=NP.int64).reshape(len(self.terms), len(classes))
+        self.classes = [int(c) for c in classes]
+
+    @classmethod
+    def from_term_counts(cls, tc):
+        """
+        returns: CountTable
+        pass in: a term_counts.TermCounts (terms w/ zero counts dropped)
+        """
+        keep = NP.flatnonzero(tc.counts.sum(axis=0))
+        terms = tc.vocab.decode(keep)
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        return cls([terms[i] for i in order], tc.counts[:, keep[order]].T, tc.classes)
+
+    @classmethod
+    def from_dicts(cls, class_counts):
+        """
+        returns: CountTable
+        pass in: dict mapping each class label to a dict whose keys are
+            terms & values are counts (eg, the result of term_counter)
+        """
+        classes = sorted(class_counts)
+        terms = sorted(set().union(*class_counts.values()))
+        counts = NP.array([[class_counts[c].get(t, 0) for c in classes] for t in terms],
+                          dtype=NP.int64)
+        return cls(terms, counts, classes)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __add__(self, other):
+        classes = sorted(set(self.classes) | set(other.classes))
+        terms = sorted(set(self.terms) | set(other.terms))
+        pos = {t: i for i, t in enumerate(terms)}
+        counts = NP.zeros((len(terms), len(classes)), dtype=NP.int64)
+        for tbl in (self, other):
+            rows = NP.fromiter((pos[t] for t in tbl.terms), dtype=NP.int64, count=len(tbl))
+            cols = [classes.index(c) for c in tbl.classes]
+            counts[NP.ix_(rows, cols)] += tbl.counts
+        return CountTable(terms, counts, classes)
+
+    def column(self, label):
+        return self.counts[:, self.classes.index(label)]
+
+    def term_counter(self, label):
+        """
+        returns: dict whose keys are terms and values are absolute counts
+            for that term, over the documents of one class
+        """
+        col = self.column(label)
+        nz = NP.flatnonzero(col)
+        tc = CL.defaultdict(int)
+        tc.update(zip((self.terms[i] for i in nz), col[nz].tolist()))
+        return tc
+
+    def top_k(self, label, k=100):
+        """
+        returns: python list of (count, term) 2-tuples, count descending;
+            terms are sorted, so ties break alphabetically
+        """
+        col = self.column(label)
+        return [(int(col[i]), self.terms[i]) for i in top_k_ids(col, k)]
+
+    def save(self, shard_dir):
+        """
+        returns: nothing; writes this table as one shard directory
+        """
+        with ShardWriter(shard_dir, self.classes) as w:
+            w.write(self.terms, self.counts)
+
+    @classmethod
+    def load(cls, shard_dir):
+        """
+        returns: CountTable, fully read into memory
+        """
+        r = ShardReader(shard_dir)
+        return cls(r.all_terms(), NP.array(r.counts), r.classes)
+
+
+class ShardWriter:
+    """
+    appends (term, counts) rows, in ascending term order, to a shard
+    directory; rows are written as they come, so a shard of any size is
+    written w/ bounded memory
+    """
+
+    def __init__(self, shard_dir, classes):
+        self.shard_dir = shard_dir
+        self.classes = [int(c) for c in classes]
+        os.makedirs(shard_dir, exist_ok=True)
+        self._terms = open(os.path.join(shard_dir, 'terms.bin'), 'wb')
+        self._offsets = open(os.path.join(shard_dir, 'offsets.i64'), 'wb')
+        self._counts = open(os.path.join(shard_dir, 'counts.i64'), 'wb')
+        self._offsets.write(NP.zeros(1, dtype=NP.int64).tobytes())
+        self._pos = 0
+        self.n_terms = 0
+
+    def write(self, terms, counts):
+        """
+        pass in: list of terms (sorted, all greater than any written
+            before) & matching (len(terms) x num_classes) count array
+        """
+        blobs = [t.encode('utf-8') for t in terms]
+        ends = self._pos + NP.cumsum([len(b) for b in blobs], dtype=NP.int64)
+        self._terms.write(b''.join(blobs))
+        self._offsets.write(ends.tobytes())
+        self._counts.write(NP.ascontiguousarray(counts, dtype=NP.int64).tobytes())
+        if len(blobs):
+            self._pos = int(ends[-1])
+        self.n_terms += len(blobs)
+
+    def close(self):
+        for fh in (self._terms, self._offsets, self._counts):
+            fh.close()
+        with open(os.path.join(self.shard_dir, 'meta.json'), 'w', encoding='utf-8') as fh:
+            json.dump({'classes': self.classes, 'n_terms': self.n_terms}, fh)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    memory-mapped view of one shard directory
+    """
+
+    def __init__(self, shard_dir):
+        with open(os.path.join(shard_dir, 'meta.json'), encoding='utf-8') as fh:
+            meta = json.load(fh)
+        self.classes = meta['classes']
+        n, C = meta['n_terms'], len(self.classes)
+        # (mmap refuses zero-length files, hence the branch)
+        if n:
+            self.offsets = NP.memmap(os.path.join(shard_dir, 'offsets.i64'), dtype=NP.int64, mode='r')
+            self._terms = NP.memmap(os.path.join(shard_dir, 'terms.bin'), dtype=NP.uint8, mode='r')
+            self.counts = NP.memmap(os.path.join(shard_dir, 'counts.i64'), dtype=NP.int64,
+                                    mode='r', shape=(n, C))
+        else:
+            self.offsets = NP.zeros(1, dtype=NP.int64)
+            self._terms = b''
+            self.counts = NP.zeros((0, C), dtype=NP.int64)
+
+    def __len__(self):
+        return self.counts.shape[0]
+
+    def term(self, i):
+        return bytes(self._terms[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def all_terms(self):
+        return [self.term(i) for i in range(len(self))]
+
+    def rows(self, block=2**14):
+        """
+        returns: generator of (term, counts) 2-tuples in term order,
+            decoding block rows at a time
+        """
+        for k in range(0, len(self), block):
+            end = min(k + block, len(self))
+            blob = bytes(self._terms[self.offsets[k]:self.offsets[end]]).decode('utf-8')
+            cuts = (self.offsets[k:end + 1] - self.offsets[k]).tolist()
+            counts = NP.array(self.counts[k:end])
+            # offsets are byte offsets; re-encode only if any term is non-ascii
+            if len(blob) != cuts[-1]:
+                raw = blob.encode('utf-8')
+                terms = [raw[a:b].decode('utf-8') for a, b in zip(cuts[:-1], cuts[1:])]
+            else:
+                terms = [blob[a:b] for a, b in zip(cuts[:-1], cuts[1:])]
+            yield from zip(terms, counts)
+
+
+def merge_shards(shard_dirs, out_dir=None, k=None, block=2**14):
+    """
+    returns: dict mapping each class label to its top-k (count, term)
+        list if k is given, else None
+    pass in:
+        (i) paths of the shard directories to reduce;
+        (ii) optional path of a shard directory to write the merged
+            counts to;
+        (iii) optional k for top-k selection on the merged counts
+    a k-way merge over the term-sorted shards: each term's counts are
+        summed as it streams past, written out in blocks & offered to
+        one size-k heap per class, so memory is bounded by the number of
+        shards, block & k--not by the merged vocabulary
+    """
+    readers = [ShardReader(d) for d in shard_dirs]
+    classes = sorted(set().union(*(r.classes for r in readers)))
+    C = len(classes)
+    # per shard: column of the merged count vector each of its classes maps to
+    cols = [NP.array([classes.index(c) for c in r.classes], dtype=NP.int64) for r in readers]
+    streams = [_tagged_rows(r, i, block) for i, r in enumerate(readers)]
+    writer = ShardWriter(out_dir, classes) if out_dir else None
+    heaps = [[] for _ in classes] if k else None
+    buf_terms, buf_counts = [], []
+
+    def emit(term, counts):
+        if writer:
+            buf_terms.append(term)
+            buf_counts.append(counts)
+            if len(buf_terms) >= block:
+                writer.write(buf_terms, NP.array(buf_counts))
+                del buf_terms[:], buf_counts[:]
+        if heaps:
+            for j, h in enumerate(heaps):
+                # ties: the alphabetically smaller term wins, as in CountTable.top_k
+                item = (int(counts[j]), _Desc(term))
+                if len(h) < k:
+                    heapq.heappush(h, item)
+                elif item > h[0]:
+                    heapq.heapreplace(h, item)
+
+    cur, acc = None, None
+    for term, i, counts in heapq.merge(*streams, key=lambda x: x[0]):
+        if term != cur:
+            if cur is not None:
+                emit(cur, acc)
+            cur, acc = term, NP.zeros(C, dtype=NP.int64)
+        acc[cols[i]] += counts
+    if cur is not None:
+        emit(cur, acc)
+    if writer:
+        if buf_terms:
+            writer.write(buf_terms, NP.array(buf_counts))
+        writer.close()
+    if not heaps:
+        return None
+    return {c: [(n, d.term) for n, d in sorted(h, reverse=True) if n > 0]
+            for c, h in zip(classes, heaps)}
+
+
+def _tagged_rows(reader, i, block):
+    for term, counts in reader.rows(block):
+        yield term, i, counts
+
+
+class _Desc:
+    """
+    wraps a term so that it compares in reverse order
+    """
+    __slots__ = ('term',)
+
+    def __init__(self, term):
+        self.term = term
+
+    def __lt__(self, other):
+        return self.term > other.term
+
+    def __eq__(self, other):
+        return self.term == other.term
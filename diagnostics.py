@@ -0,0 +1,99 @@
+# coding: utf-8
+
+"""
+degeneracy checks on the structured data matrix: zero-variance columns
+(which standardizing would divide by zero) & collinear column pairs,
+w/ correlations computed over every column from the Gram matrix X^T X,
+a block of rows of it at a time, so neither a dense copy of X nor the
+full correlation matrix is needed
+"""
+
+import numpy as NP
+from scipy import sparse as SPS
+
+from scaling import StandardScaler
+
+
+def zero_variance_columns(X):
+    """
+    returns: 1D int64 array of the offsets of constant columns (eg,
+        terms that occur in no data instance), w/ variance zero up to
+        rounding (see scaling.VAR_RTOL)
+    pass in: 2D NumPy array or scipy.sparse matrix
+    """
+    return NP.flatnonzero(StandardScaler(with_mean=False).fit(X).constant)
+
+
+def drop_zero_variance(X):
+    """
+    returns: (X, kept) 2-tuple: X w/o its constant columns (same kind
+        as X passed in) & 1D int64 array of the offsets of the columns
+        kept, to select the matching terms
+    """
+    drop = zero_variance_columns(X)
+    kept = NP.setdiff1d(NP.arange(X.shape[1]), drop)
+    if not drop.shape[0]:
+        return X, kept
+    return (X.tocsc()[:, kept].tocsr() if SPS.issparse(X) else X[:, kept]), kept
+
+
+def correlation_blocks(X, block=1024):
+    """
+    returns: generator of (a, R) 2-tuples, R the (b x n_cols) float64
+        Pearson correlations of columns a .. a + b - 1 w/ every column;
+        constant columns correlate as NaN
+    pass in: 2D NumPy array or scipy.sparse matrix & the number of rows
+        of the correlation matrix per block (memory is block x n_cols)
+    corr_ij = (G_ij / n - mean_i * mean_j) / (std_i * std_j), where G is
+        the Gram matrix X^T X; for sparse X only stored values enter the
+        product
+    """
+    sc = StandardScaler(with_mean=False).fit(X)
+    n, mean, const = sc.n_samples, sc.mean, sc.constant
+    with NP.errstate(divide='ignore', invalid='ignore'):
+        inv = NP.where(const, NP.nan, 1. / NP.sqrt(sc.var))
+    if SPS.issparse(X):
+        X = SPS.csc_matrix(X, dtype=NP.float64)
+        XT = X.T.tocsr()
+    else:
+        X = NP.asarray(X, dtype=NP.float64)
+    for a in range(0, X.shape[1], block):
+        b = min(a + block, X.shape[1])
+        if SPS.issparse(X):
+            G = (XT[a:b] @ X).toarray()
+        else:
+            G = X[:, a:b].T @ X
+        R = (G / n - NP.outer(mean[a:b], mean)) * inv[a:b, None] * inv[None, :]
+        # rounding can push |r| a hair past 1, or the diagonal off 1
+        NP.clip(R, -1., 1., out=R)
+        R[NP.arange(b - a), NP.arange(a, b)] = NP.where(const[a:b], NP.nan, 1.)
+        yield a, R
+
+
+def correlation_matrix(X, block=1024):
+    """
+    returns: (n_cols x n_cols) float64 correlation matrix, the same as
+        NP.corrcoef(X, rowvar=0) but over every column & for sparse X
+    """
+    C = NP.empty((X.shape[1], X.shape[1]))
+    for a, R in correlation_blocks(X, block):
+        C[a:a + R.shape[0]] = R
+    return C
+
+
+def collinear_pairs(X, threshold=.9, block=1024):
+    """
+    returns: python list of (r, (i, j)) 2-tuples, the column pairs i < j
+        whose correlation has |r| >= threshold, |r| descending
+    pass in: 2D NumPy array or scipy.sparse matrix, the threshold &
+        the block size of correlation_blocks
+    only the pairs over the threshold are kept from each block
+    """
+    found = []
+    for a, R in correlation_blocks(X, block):
+        i, j = NP.nonzero(NP.abs(NP.nan_to_num(R)) >= threshold)
+        i += a
+        upper = i < j
+        found.extend(zip(R[i[upper] - a, j[upper]].tolist(),
+                         zip(i[upper].tolist(), j[upper].tolist())))
+    return sorted(found, key=lambda rp: (-abs(rp[0]), rp[1]))
@@ -0,0 +1,214 @@
+# coding: utf-8
+
+"""
+integer-encoded corpus: each term is mapped to an int32 id by a
+Vocabulary & the corpus is stored as one flat token-id array plus an
+offsets array, instead of a list (or object array) of lists of str
+"""
+
+import array
+
+import numpy as NP
+
+
+class Vocabulary:
+    """
+    bidirectional term <-> int id map; ids are assigned in order of
+    first appearance, so the same input stream always yields the same ids
+
+    pass in: optional iterable of terms to seed the vocabulary
+    """
+
+    def __init__(self, terms=()):
+        self.terms = []
+        self.index = {}
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, term):
+        return term in self.index
+
+    def __getitem__(self, term_id):
+        return self.terms[term_id]
+
+    def add(self, term):
+        """
+        returns: id for term, assigning the next free id if it is new
+        """
+        term_id = self.index.get(term)
+        if term_id is None:
+            term_id = self.index[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def encode(self, tokens, grow=True):
+        """
+        returns: 1D NumPy array of dtype 'int32', one id per token
+        pass in:
+            (i) iterable of terms (one data instance)
+            (ii) if False, unseen terms are encoded as -1 rather than
+                added to the vocabulary
+        """
+        if grow:
+            add = self.add
+            return NP.fromiter((add(t) for t in tokens), dtype=NP.int32)
+        get = self.index.get
+        return NP.fromiter((get(t, -1) for t in tokens), dtype=NP.int32)
+
+    def decode(self, ids):
+        """
+        returns: python list of terms
+        pass in: iterable of term ids
+        """
+        terms = self.terms
+        return [terms[i] for i in ids]
+
+
+class EncodedCorpus:
+    """
+    a corpus held as three flat NumPy arrays:
+        tokens: int32 term ids of every document, concatenated
+        offsets: int64, length n_docs + 1; document i is
+            tokens[offsets[i]:offsets[i+1]]
+        labels: int8 class label per document
+    plus the Vocabulary that decodes the ids; ~4 bytes per token
+    vs ~50+ for a list of python str
+    """
+
+    def __init__(self, tokens, offsets, labels, vocab):
+        self.tokens = NP.asarray(tokens, dtype=NP.int32)
+        self.offsets = NP.asarray(offsets, dtype=NP.int64)
+        self.labels = NP.asarray(labels, dtype=NP.int8)
+        self.vocab = vocab
+        assert self.offsets.shape[0] == self.labels.shape[0] + 1
+
+    @classmethod
+    def from_stream(cls, pairs, vocab=None):
+        """
+        returns: EncodedCorpus
+        pass in:
+            (i) iterable of (tokens, label) 2-tuples, eg, the generator
+                returned by read_corpus
+            (ii) optional Vocabulary to extend, default is a new one
+        consumes the stream one document at a time, appending ids to
+            compact typed buffers, so the list-of-lists is never built
+        """
+        vocab = vocab if vocab is not None else Vocabulary()
+        add = vocab.add
+        tokens, offsets, labels = array.array('i'), array.array('q', [0]), array.array('b')
+        for doc, label in pairs:
+            tokens.extend(add(t) for t in doc)
+            offsets.append(len(tokens))
+            labels.append(label)
+        return cls(NP.frombuffer(tokens, dtype=NP.int32),
+                   NP.frombuffer(offsets, dtype=NP.int64),
+                   NP.frombuffer(labels, dtype=NP.int8), vocab)
+
+    @classmethod
+    def from_documents(cls, docs, labels, vocab=None):
+        """
+        returns: EncodedCorpus
+        pass in:
+            (i) nested list in which each list is one 'bag of words'
+            (ii) sequence of class labels, one per document
+            (iii) optional Vocabulary to extend
+        """
+        assert len(docs) == len(labels)
+        return cls.from_stream(zip(docs, labels), vocab)
+
+    def __len__(self):
+        return self.labels.shape[0]
+
+    def doc(self, i):
+        """
+        returns: 1D int32 view of document i's term ids (no copy)
+        """
+        return self.tokens[self.offsets[i]:self.offsets[i + 1]]
+
+    def doc_lengths(self):
+        """
+        returns: 1D int64 array, number of tokens per document
+        """
+        return NP.diff(self.offsets)
+
+    def doc_ids(self):
+        """
+        returns: 1D int64 array, same length as tokens, holding the
+            document (row) number each token belongs to
+        """
+        return NP.repeat(NP.arange(len(self), dtype=NP.int64), self.doc_lengths())
+
+    def subset(self, idx):
+        """
+        returns: new EncodedCorpus holding documents idx, in that order
+        pass in: 1D array of document numbers or a boolean mask
+        """
+        idx = NP.arange(len(self))[idx] if NP.asarray(idx).dtype == bool else NP.asarray(idx)
+        lengths = self.doc_lengths()[idx]
+        offsets = NP.zeros(idx.shape[0] + 1, dtype=NP.int64)
+        NP.cumsum(lengths, out=offsets[1:])
+        # gather each selected document's token span into one index array
+        starts = NP.repeat(self.offsets[idx] - offsets[:-1], lengths)
+        take = starts + NP.arange(offsets[-1], dtype=NP.int64)
+        return EncodedCorpus(self.tokens[take], offsets, self.labels[idx], self.vocab)
+
+    def split_by_class(self):
+        """
+        returns: dict, one EncodedCorpus per class label
+        """
+        return {int(c): self.subset(self.labels == c) for c in NP.unique(self.labels)}
+
+    def save(self, file_path):
+        """
+        returns: nothing; writes the three arrays plus the vocabulary
+            (terms joined by newlines, as utf-8 bytes) to one uncompressed
+            .npz file
+        pass in: path to the file to write
+        """
+        terms = '\n'.join(self.vocab.terms).encode('utf-8')
+        with open(file_path, 'wb') as fh:
+            NP.savez(fh, tokens=self.tokens, offsets=self.offsets,
+                     labels=self.labels, vocab=NP.frombuffer(terms, dtype=NP.uint8))
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        returns: EncodedCorpus
+        pass in: path to a file written by EncodedCorpus.save
+        """
+        with NP.load(file_path) as z:
+            terms = z['vocab'].tobytes().decode('utf-8')
+            vocab = Vocabulary(terms.split('\n') if terms else ())
+            return cls(z['tokens'], z['offsets'], z['labels'], vocab)
+
+    def documents(self):
+        """
+        returns: generator of python lists of terms, one per document
+        """
+        for i in range(len(self)):
+            yield self.vocab.decode(self.doc(i))
+
+    def term_counter(self):
+        """
+        returns: dict whose keys are terms and values are absolute counts
+            for that term (same as the notebooks' term_counter, computed
+            w/ one bincount over the token ids)
+        """
+        counts = NP.bincount(self.tokens, minlength=len(self.vocab))
+        nz = NP.flatnonzero(counts)
+        return dict(zip(self.vocab.decode(nz), counts[nz].tolist()))
+
+    def build_feature_vector(self, feature_vector, sparse=False, dtype=NP.float64):
+        """
+        returns: a structured 2D data array in which each column encodes
+            one discrete feature (the count of one term); each row
+            represents one data instance
+        pass in: a template feature vector: a list of terms; columns
+            follow the order of first appearance in this list; see
+            vectorize.build_feature_vector for sparse & dtype
+        """
+        from vectorize import build_feature_vector
+        return build_feature_vector(self, feature_vector, sparse, dtype)
@@ -0,0 +1,193 @@
+# coding: utf-8
+
+"""
+append-only, sharded store for the structured data matrix: rows are
+written as shards of at most shard_rows rows (each a matrix_io
+directory), & a manifest records the vocabulary version, the columns'
+terms, each shard's row count & label counts; appending writes only the
+new shards, & readers memory-map one shard at a time, or many in
+parallel, so the matrix can be larger than RAM
+
+layout:
+    manifest.json
+    shard-00000/    save_matrix directory: arrays, labels & meta.json
+    shard-00001/
+    ...
+"""
+
+import os
+import json
+import multiprocessing as MP
+
+import numpy as NP
+from scipy import sparse as SPS
+
+from matrix_io import save_matrix, load_matrix
+
+
+MANIFEST = 'manifest.json'
+
+
+class FeatureStore:
+    """
+    pass in:
+        store_dir: path of the store directory, created if need be
+        vocab_version: version of the vectorizer that produced the
+            columns (eg, CountVectorizer.version)
+        terms: optional list of column terms, recorded in the manifest
+        shard_rows: maximum rows per shard, default is 2**20
+    an existing store is reopened as it was created: any of the three
+    passed in must match the manifest (a store created w/o a version or
+    terms matches none), else ValueError, so rows built w/ other columns
+    can't be mixed in
+    """
+
+    def __init__(self, store_dir, vocab_version=None, terms=None, shard_rows=None):
+        self.store_dir = store_dir
+        fp = os.path.join(store_dir, MANIFEST)
+        terms = list(terms) if terms is not None else None
+        if os.path.exists(fp):
+            with open(fp, encoding='utf-8') as fh:
+                self.manifest = json.load(fh)
+            for key, value in (('vocab_version', vocab_version), ('terms', terms),
+                               ('shard_rows', shard_rows)):
+                have = self.manifest[key]
+                if value is None or value == have:
+                    continue
+                if key == 'terms' and have is not None:
+                    i = next((i for i, (a, b) in enumerate(zip(have, value)) if a != b),
+                             min(len(have), len(value)))
+                    raise ValueError("store was built w/ other terms: {0} vs {1} columns, "
+                                     "first difference at column {2}".format(len(have), len(value), i))
+                raise ValueError("store was built w/ {0} {1}, not {2}".format(
+                    key, have, '{0} terms'.format(len(value)) if key == 'terms' else value))
+        else:
+            os.makedirs(store_dir, exist_ok=True)
+            self.manifest = {'vocab_version': vocab_version, 'terms': terms,
+                             'n_features': len(terms) if terms is not None else None,
+                             'shard_rows': shard_rows or 2**20, 'n_rows': 0, 'shards': []}
+            self._write_manifest()
+
+    def _write_manifest(self):
+        # atomic: readers see the old manifest or the new one, never half
+        fp = os.path.join(self.store_dir, MANIFEST)
+        with open(fp + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump(self.manifest, fh)
+        os.replace(fp + '.tmp', fp)
+
+    def __len__(self):
+        return self.manifest['n_rows']
+
+    @property
+    def n_shards(self):
+        return len(self.manifest['shards'])
+
+    @property
+    def terms(self):
+        return self.manifest['terms']
+
+    def shard_path(self, i):
+        return os.path.join(self.store_dir, self.manifest['shards'][i]['name'])
+
+    def append(self, X, labels):
+        """
+        returns: number of shards written
+        pass in: 2D NumPy array or scipy.sparse matrix of new rows & 1D
+            array of their class labels
+        rows go into new shards of at most shard_rows rows (existing
+            shards are never rewritten); each shard is written in full
+            before the manifest is updated, so an interrupted append
+            leaves the store as it was
+        """
+        labels = NP.asarray(labels)
+        if labels.shape[0] != X.shape[0]:
+            raise ValueError("{0} labels for {1} rows".format(labels.shape[0], X.shape[0]))
+        n_features = self.manifest['n_features']
+        if n_features is not None and X.shape[1] != n_features:
+            raise ValueError("{0} columns, store has {1}".format(X.shape[1], n_features))
+        if SPS.issparse(X):
+            X = SPS.csr_matrix(X)
+        step = self.manifest['shard_rows']
+        shards = []
+        for a in range(0, X.shape[0], step):
+            # names of any shards orphaned by an interrupted append are reused
+            name = 'shard-{0:05d}'.format(self.n_shards + len(shards))
+            lbl = labels[a:a + step]
+            save_matrix(os.path.join(self.store_dir, name), X[a:a + step], lbl,
+                        meta={'vocab_version': self.manifest['vocab_version']})
+            classes, counts = NP.unique(lbl, return_counts=True)
+            shards.append({'name': name, 'n_rows': int(lbl.shape[0]),
+                           'label_counts': {str(c): int(n) for c, n in zip(classes.tolist(), counts)}})
+        self.manifest['n_features'] = X.shape[1]
+        self.manifest['shards'].extend(shards)
+        self.manifest['n_rows'] += X.shape[0]
+        self._write_manifest()
+        return len(shards)
+
+    def shard(self, i, mmap=True):
+        """
+        returns: (X, labels) 2-tuple for shard i, memory-mapped read-only
+            by default (see matrix_io.load_matrix)
+        """
+        X, labels, _ = load_matrix(self.shard_path(i), mmap)
+        return X, labels
+
+    def iter_shards(self, mmap=True):
+        """
+        returns: generator of (X, labels) 2-tuples, one per shard, in
+            row order
+        """
+        for i in range(self.n_shards):
+            yield self.shard(i, mmap)
+
+    def labels(self):
+        """
+        returns: 1D array of all labels, in row order
+        """
+        parts = [lbl for _, lbl in self.iter_shards()]
+        return NP.concatenate(parts) if parts else NP.zeros(0, dtype=NP.int8)
+
+    def label_counts(self):
+        """
+        returns: dict mapping each class label (str, as in the manifest)
+            to its number of rows, from the manifest alone
+        """
+        counts = {}
+        for s in self.manifest['shards']:
+            for c, n in s['label_counts'].items():
+                counts[c] = counts.get(c, 0) + n
+        return counts
+
+    def map_shards(self, fn, n_workers=None):
+        """
+        returns: python list of fn(X, labels), one per shard, in row order
+        pass in: picklable callable taking one shard's (X, labels), &
+            the number of worker processes, default is os.cpu_count()
+        each worker memory-maps its own shard, so only results, not
+            rows, cross process boundaries
+        """
+        tasks = [(fn, self.shard_path(i)) for i in range(self.n_shards)]
+        if not tasks:
+            return []
+        with MP.Pool(n_workers or os.cpu_count()) as pool:
+            return pool.map(_apply_to_shard, tasks)
+
+    def to_matrix(self):
+        """
+        returns: (X, labels) 2-tuple of all rows, read into memory (dense
+            if the shards are dense, else CSR)
+        """
+        parts = list(self.iter_shards())
+        if not parts:
+            return NP.zeros((0, self.manifest['n_features'] or 0)), NP.zeros(0, dtype=NP.int8)
+        if SPS.issparse(parts[0][0]):
+            X = SPS.vstack([x for x, _ in parts], format='csr')
+        else:
+            X = NP.concatenate([x for x, _ in parts])
+        return X, NP.concatenate([lbl for _, lbl in parts])
+
+
+def _apply_to_shard(args):
+    fn, shard_dir = args
+    X, labels, _ = load_matrix(shard_dir)
+    return fn(X, labels)
@@ -0,0 +1,180 @@
+# coding: utf-8
+
+"""
+bit-packed boolean incidence matrix: term presence/absence by document,
+64 documents per uint64 word, so co-occurrence & Jaccard-style queries
+are AND/OR plus popcount over 1/8 the memory of a bool array
+"""
+
+import numpy as NP
+from scipy import sparse as SPS
+
+
+if hasattr(NP, 'bitwise_count'):
+    def popcount(words):
+        """
+        returns: array of the number of set bits in each element
+        pass in: array of unsigned ints
+        """
+        return NP.bitwise_count(words)
+else:
+    _POP8 = NP.array([bin(i).count('1') for i in range(256)], dtype=NP.uint8)
+
+    def popcount(words):
+        """
+        returns: array of the number of set bits in each element
+        pass in: array of unsigned ints
+        """
+        w = NP.ascontiguousarray(words)
+        b = _POP8[w.view(NP.uint8)].reshape(w.shape + (w.itemsize,))
+        return b.sum(axis=-1, dtype=NP.uint8)
+
+
+def _pack(B):
+    """
+    returns: (n x ceil(m/64)) uint64 array
+    pass in: (n x m) bool array, one row per term, one column per document
+    """
+    n, m = B.shape
+    nw = (m + 63) // 64
+    bytes_ = NP.packbits(B, axis=1, bitorder='little')
+    out = NP.zeros((n, nw * 8), dtype=NP.uint8)
+    out[:, :bytes_.shape[1]] = bytes_
+    return out.view('<u8').astype(NP.uint64, copy=False)
+
+
+def _unpack(words, m):
+    """
+    returns: (n x m) bool array; the inverse of _pack
+    """
+    b = NP.ascontiguousarray(words, dtype='<u8').view(NP.uint8)
+    return NP.unpackbits(b, axis=1, count=m, bitorder='little').astype(bool)
+
+
+class BitIncidence:
+    """
+    a (documents x terms) boolean matrix stored term-major: words[j] is
+    the bitset of documents containing term j, document i at bit i % 64
+    of word i // 64; padding bits past the last document are always 0
+
+    pass in:
+        words: (n_terms x ceil(n_docs/64)) uint64 array
+        n_docs: number of documents (rows of the logical matrix)
+    """
+
+    def __init__(self, words, n_docs):
+        self.words = NP.asarray(words, dtype=NP.uint64)
+        self.n_docs = n_docs
+        assert self.words.shape[1] == (n_docs + 63) // 64
+
+    @classmethod
+    def from_dense(cls, D, block=4096):
+        """
+        returns: BitIncidence of D > 0
+        pass in: (documents x terms) 2D NumPy array, eg, the notebooks' D;
+            packed block terms at a time, so no full bool copy is made
+        """
+        m, n = D.shape
+        words = NP.zeros((n, (m + 63) // 64), dtype=NP.uint64)
+        for j in range(0, n, block):
+            words[j:j + block] = _pack(NP.asarray(D[:, j:j + block] > 0).T)
+        return cls(words, m)
+
+    @classmethod
+    def from_sparse(cls, X):
+        """
+        returns: BitIncidence of X > 0
+        pass in: (documents x terms) scipy.sparse matrix
+        """
+        X = SPS.coo_matrix(X)
+        keep = X.data > 0
+        docs, terms = X.row[keep].astype(NP.int64), X.col[keep].astype(NP.int64)
+        words = NP.zeros((X.shape[1], (X.shape[0] + 63) // 64), dtype=NP.uint64)
+        bits = NP.left_shift(NP.uint64(1), (docs & 63).astype(NP.uint64))
+        NP.bitwise_or.at(words, (terms, docs >> 6), bits)
+        return cls(words, X.shape[0])
+
+    @property
+    def shape(self):
+        return (self.n_docs, self.words.shape[0])
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def to_dense(self):
+        """
+        returns: (documents x terms) bool array
+        """
+        return _unpack(self.words, self.n_docs).T
+
+    def to_sparse(self, block=4096):
+        """
+        returns: (documents x terms) scipy.sparse CSR matrix of dtype bool
+        pass in: number of terms unpacked at a time
+        unpacked block terms at a time, so no full bool copy is made: a
+            block's nonzeros, in term-major order, are the CSC row indices
+            of its columns, written straight into place
+        """
+        indptr = NP.zeros(self.words.shape[0] + 1, dtype=NP.int64)
+        NP.cumsum(self.doc_freq(), out=indptr[1:])
+        indices = NP.empty(indptr[-1], dtype=NP.int64)
+        for j in range(0, self.words.shape[0], block):
+            _, docs = NP.nonzero(_unpack(self.words[j:j + block], self.n_docs))
+            indices[indptr[j]:indptr[j] + docs.shape[0]] = docs
+        data = NP.ones(indices.shape[0], dtype=bool)
+        return SPS.csc_matrix((data, indices, indptr), shape=self.shape).tocsr()
+
+    def __and__(self, other):
+        assert self.shape == other.shape
+        return BitIncidence(self.words & other.words, self.n_docs)
+
+    def __or__(self, other):
+        assert self.shape == other.shape
+        return BitIncidence(self.words | other.words, self.n_docs)
+
+    def select_terms(self, idx):
+        """
+        returns: BitIncidence of the columns (terms) idx, in that order
+        """
+        return BitIncidence(self.words[idx], self.n_docs)
+
+    def select_docs(self, idx, block=4096):
+        """
+        returns: BitIncidence of the rows (documents) idx, in that order
+        pass in: 1D array of document numbers or a boolean mask
+        documents are repacked block terms at a time
+        """
+        idx = NP.arange(self.n_docs)[idx]
+        m = idx.shape[0]
+        words = NP.zeros((self.words.shape[0], (m + 63) // 64), dtype=NP.uint64)
+        for j in range(0, self.words.shape[0], block):
+            words[j:j + block] = _pack(_unpack(self.words[j:j + block], self.n_docs)[:, idx])
+        return BitIncidence(words, m)
+
+    def doc_freq(self):
+        """
+        returns: 1D int64 array, number of documents containing each term
+            (the column sums of the logical matrix)
+        """
+        return popcount(self.words).sum(axis=1, dtype=NP.int64)
+
+    def cofreq(self, i, j):
+        """
+        returns: number of documents containing both term i & term j
+        """
+        return int(popcount(self.words[i] & self.words[j]).sum(dtype=NP.int64))
+
+    def union_freq(self, i, j):
+        """
+        returns: number of documents containing term i or term j
+        """
+        return int(popcount(self.words[i] | self.words[j]).sum(dtype=NP.int64))
+
+    def jaccard(self, i, j):
+        """
+        returns: |docs(i) & docs(j)| / |docs(i) | docs(j)|, 0 if neither
+            term occurs
+        """
+        u = self.union_freq(i, j)
+        return self.cofreq(i, j) / u if u else 0.
@@ -0,0 +1,227 @@
+# coding: utf-8
+
+"""
+incremental processing of a corpus that grows by appending: new app
+descriptions & labels are added to the end of 'data.txt' &
+'class_labels.txt' every day, so only the appended lines are tokenized,
+counted & turned into feature matrix rows
+"""
+
+import os
+import json
+import itertools as IT
+
+import numpy as NP
+
+from encoded_corpus import EncodedCorpus, Vocabulary
+
+
+def _iter_lines(file_path, pos=0, encoding='utf-8'):
+    """
+    returns: generator of (line, end) 2-tuples: each complete line
+        starting at byte offset pos & the byte offset just past it
+    lines end at b'\n' only, so a file is split the same way whether
+        read from the start or resumed mid-way; a trailing partial line,
+        still being written, is left for next time
+    """
+    with open(file_path, mode='rb') as fh:
+        fh.seek(pos)
+        for raw in fh:
+            if not raw.endswith(b'\n'):
+                return
+            pos += len(raw)
+            yield raw.decode(encoding), pos
+
+
+def _read_new_lines(file_path, pos, encoding='utf-8'):
+    """
+    returns: python list of the complete lines starting at byte offset
+        pos, & the byte offset just past each
+    """
+    found = list(_iter_lines(file_path, pos, encoding))
+    return [line for line, _ in found], [end for _, end in found]
+
+
+class IncrementalCorpus:
+    """
+    per-class term counts & a feature matrix kept up to date w/ an
+    append-only corpus; everything lives in state_dir:
+        state.json    byte offsets & line count processed so far, row
+                      & term counts, name of the counts file, feature
+                      vector & tokenizer config
+        vocab.txt     one term per line, in id order (append-only)
+        counts-<n_lines>.npz
+                      one int64 term-count array per class label, as of
+                      n_lines lines; only the file state.json names is read
+        features.f64  the feature matrix, raw float64 rows (append-only)
+        labels.i8     the class label of each row (append-only)
+
+    pass in:
+        state_dir: directory holding the state, created if needed
+        data_file, labels_file: absolute paths to the two corpus files
+        tokenize: a text_prep.Tokenizer
+        min_doc_len: fewest tokens a document needs to be kept, default
+            is 11 (ie, the notebooks' 'lx > 10')
+    """
+
+    def __init__(self, state_dir, data_file, labels_file, tokenize, min_doc_len=11):
+        self.state_dir = state_dir
+        self.data_file = data_file
+        self.labels_file = labels_file
+        self.tokenize = tokenize
+        self.min_doc_len = min_doc_len
+        os.makedirs(state_dir, exist_ok=True)
+        cfg = {'tokenizer': tokenize.config(), 'min_doc_len': min_doc_len}
+        state = self._load_json('state.json')
+        if state is None or state['config'] != cfg:
+            # first run, or the token stream itself changed: start over
+            state = {'config': cfg, 'data_pos': 0, 'labels_pos': 0,
+                     'n_lines': 0, 'n_rows': 0, 'n_terms': 0, 'counts': None,
+                     'feature_vector': None}
+            self._reset_files()
+        self.state = state
+        self._truncate_rows()
+        self.vocab = Vocabulary(self._load_terms())
+        self.counts = self._load_counts()
+
+    def _path(self, fn):
+        return os.path.join(self.state_dir, fn)
+
+    def _load_json(self, fn):
+        if not os.path.exists(self._path(fn)):
+            return None
+        with open(self._path(fn), encoding='utf-8') as fh:
+            return json.load(fh)
+
+    def _load_terms(self):
+        if not os.path.exists(self._path('vocab.txt')):
+            return []
+        # terms past n_terms were appended by an update that never committed
+        with open(self._path('vocab.txt'), encoding='utf-8') as fh:
+            return [line.rstrip('\n') for line in IT.islice(fh, self.state['n_terms'])]
+
+    def _load_counts(self):
+        if self.state['counts'] is None:
+            return {}
+        with NP.load(self._path(self.state['counts'])) as z:
+            return {int(k): z[k] for k in z.files}
+
+    def _counts_files(self):
+        return [fn for fn in os.listdir(self.state_dir)
+                if fn.startswith('counts-') and fn.endswith('.npz')]
+
+    def _reset_files(self):
+        for fn in ['vocab.txt', 'features.f64', 'labels.i8'] + self._counts_files():
+            if os.path.exists(self._path(fn)):
+                os.remove(self._path(fn))
+
+    def _truncate_rows(self):
+        # drop rows appended by an update that never committed its state
+        m, n = self.state['n_rows'], len(self.state['feature_vector'] or ())
+        for fn, row_bytes in (('features.f64', 8 * n), ('labels.i8', 1)):
+            if os.path.exists(self._path(fn)):
+                os.truncate(self._path(fn), m * row_bytes)
+
+    def _save_state(self, n_terms_before):
+        with open(self._path('vocab.txt'), 'a', encoding='utf-8') as fh:
+            fh.writelines(t + '\n' for t in self.vocab.terms[n_terms_before:])
+        self.state['n_terms'] = len(self.vocab)
+        # the counts go to a new file per generation, never over the one
+        # the committed state names: a crash before state.json is replaced
+        # leaves the old state w/ the old counts, so no line is counted twice
+        fn = 'counts-{0}.npz'.format(self.state['n_lines'])
+        if fn != self.state['counts']:
+            with open(self._path(fn + '.tmp'), 'wb') as fh:
+                NP.savez(fh, **{str(c): v for c, v in self.counts.items()})
+            os.replace(self._path(fn + '.tmp'), self._path(fn))
+            self.state['counts'] = fn
+        # state.json is written last: it marks the update as committed
+        with open(self._path('state.json.tmp'), 'w', encoding='utf-8') as fh:
+            json.dump(self.state, fh)
+        os.replace(self._path('state.json.tmp'), self._path('state.json'))
+        for old in self._counts_files():
+            if old != fn:
+                os.remove(self._path(old))
+
+    def _add_counts(self, corpus):
+        n = len(self.vocab)
+        for c, part in corpus.split_by_class().items():
+            new = NP.bincount(part.tokens, minlength=n).astype(NP.int64)
+            old = self.counts.get(c, NP.zeros(0, dtype=NP.int64))
+            new[:old.shape[0]] += old
+            self.counts[c] = new
+
+    def _append_rows(self, corpus):
+        D = corpus.build_feature_vector(self.state['feature_vector'])
+        with open(self._path('features.f64'), 'ab') as fh:
+            fh.write(D.tobytes())
+        with open(self._path('labels.i8'), 'ab') as fh:
+            fh.write(corpus.labels.tobytes())
+        self.state['n_rows'] += D.shape[0]
+
+    def update(self):
+        """
+        returns: number of new documents kept
+        tokenizes only the lines appended since the last call, adds them
+            to the per-class term counts &, if a feature vector has been
+            set, appends their rows to the feature matrix
+        """
+        data, d_ends = _read_new_lines(self.data_file, self.state['data_pos'])
+        labels, l_ends = _read_new_lines(self.labels_file, self.state['labels_pos'])
+        # only lines present in both files are processed
+        n = min(len(data), len(labels))
+        if n == 0:
+            return 0
+        pairs = ((self.tokenize(line), int(label)) for line, label in zip(data[:n], labels[:n]))
+        n_terms = len(self.vocab)
+        corpus = EncodedCorpus.from_stream(pairs, self.vocab)
+        corpus = corpus.subset(corpus.doc_lengths() >= self.min_doc_len)
+        self._add_counts(corpus)
+        if self.state['feature_vector'] is not None:
+            self._append_rows(corpus)
+        self.state['data_pos'], self.state['labels_pos'] = d_ends[n - 1], l_ends[n - 1]
+        self.state['n_lines'] += n
+        self._save_state(n_terms)
+        return len(corpus)
+
+    def set_feature_vector(self, feature_vector):
+        """
+        returns: nothing
+        pass in: list of terms, one per column
+        the only full rebuild: when the vocabulary of the feature matrix
+            changes, every processed line is re-read & the matrix rewritten
+        """
+        self.state['feature_vector'] = list(dict.fromkeys(feature_vector))
+        self.state['n_rows'] = 0
+        for fn in ('features.f64', 'labels.i8'):
+            if os.path.exists(self._path(fn)):
+                os.remove(self._path(fn))
+        # lines are split exactly as update() splits them, & only those
+        # already processed are read; update() picks up the rest
+        lines = zip(_iter_lines(self.data_file), _iter_lines(self.labels_file))
+        lines = IT.islice(lines, self.state['n_lines'])
+        pairs = ((self.tokenize(line), int(label)) for (line, _), (label, _) in lines)
+        corpus = EncodedCorpus.from_stream(pairs, Vocabulary())
+        self._append_rows(corpus.subset(corpus.doc_lengths() >= self.min_doc_len))
+        self._save_state(len(self.vocab))
+
+    def term_counter(self, label):
+        """
+        returns: dict whose keys are terms and values are absolute counts
+            for that term, over the documents of one class
+        """
+        counts = self.counts.get(label, NP.zeros(0, dtype=NP.int64))
+        nz = NP.flatnonzero(counts)
+        return dict(zip(self.vocab.decode(nz), counts[nz].tolist()))
+
+    def features(self):
+        """
+        returns: (D, L) 2-tuple; D is a read-only memory-mapped 2D float64
+            array, one row per kept document, L the int8 class labels
+        """
+        m, n = self.state['n_rows'], len(self.state['feature_vector'] or ())
+        if m == 0:
+            return NP.zeros((0, n)), NP.zeros(0, dtype=NP.int8)
+        D = NP.memmap(self._path('features.f64'), dtype=NP.float64, mode='r', shape=(m, n))
+        L = NP.fromfile(self._path('labels.i8'), dtype=NP.int8)
+        return D, L
@@ -0,0 +1,96 @@
+# coding: utf-8
+
+"""
+binary persistence for the structured data matrix: one directory per
+matrix, each array a raw .npy file, so loading is a memory map--no
+parsing & no copy--& training can start reading rows at once
+
+layout of a saved directory:
+    meta.json       kind ('dense' or 'csr'), shape, dtype, columns'
+                    terms & any extra metadata; written last, so a
+                    directory w/o it is an incomplete write
+    X.npy           the matrix, if dense
+    data.npy, indices.npy, indptr.npy
+                    the CSR component arrays, if sparse
+    labels.npy      class labels, one per row (optional)
+"""
+
+import os
+import json
+
+import numpy as NP
+from scipy import sparse as SPS
+
+
+META = 'meta.json'
+ARRAYS = ('X.npy', 'data.npy', 'indices.npy', 'indptr.npy', 'labels.npy')
+
+
+def save_matrix(out_dir, X, labels=None, terms=None, meta=None):
+    """
+    returns: out_dir
+    pass in:
+        (i) path of the directory to write (created if need be);
+        (ii) the data: 2D NumPy array or scipy.sparse matrix (stored
+            as CSR);
+        (iii) optional 1D array of class labels, one per row;
+        (iv) optional list of column terms, eg, CountVectorizer.terms;
+        (v) optional dict of extra JSON-serializable metadata, eg, the
+            vectorizer's version
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    # meta.json first: an old one would vouch for arrays being replaced
+    for name in (META,) + ARRAYS:
+        if os.path.exists(os.path.join(out_dir, name)):
+            os.remove(os.path.join(out_dir, name))
+    if SPS.issparse(X):
+        X = SPS.csr_matrix(X)
+        # int32 indices where they fit: scipy keeps those w/o a copy
+        idx_dtype = NP.int32 if max(X.nnz, X.shape[1]) < 2**31 else NP.int64
+        NP.save(os.path.join(out_dir, 'data.npy'), X.data)
+        NP.save(os.path.join(out_dir, 'indices.npy'), X.indices.astype(idx_dtype, copy=False))
+        NP.save(os.path.join(out_dir, 'indptr.npy'), X.indptr.astype(idx_dtype, copy=False))
+        kind = 'csr'
+    else:
+        X = NP.asarray(X)
+        assert X.ndim == 2, "pass in a 2D array"
+        NP.save(os.path.join(out_dir, 'X.npy'), X)
+        kind = 'dense'
+    if labels is not None:
+        labels = NP.asarray(labels)
+        if labels.shape[0] != X.shape[0]:
+            raise ValueError("{0} labels for {1} rows".format(labels.shape[0], X.shape[0]))
+        NP.save(os.path.join(out_dir, 'labels.npy'), labels)
+    if terms is not None and len(terms) != X.shape[1]:
+        raise ValueError("{0} terms for {1} columns".format(len(terms), X.shape[1]))
+    info = {'kind': kind, 'shape': list(X.shape), 'dtype': X.dtype.str,
+            'labels': labels is not None,
+            'terms': list(terms) if terms is not None else None,
+            'meta': meta or {}}
+    with open(os.path.join(out_dir, META), 'w', encoding='utf-8') as fh:
+        json.dump(info, fh)
+    return out_dir
+
+
+def load_matrix(in_dir, mmap=True):
+    """
+    returns: (X, labels, info) 3-tuple: the matrix (NumPy array or CSR
+        matrix), the labels (None if none were saved) & the meta.json
+        dict (shape, dtype, 'terms', 'meta', ...)
+    pass in: path of a directory written by save_matrix & whether to
+        memory-map the arrays read-only (the default) or read them
+    """
+    with open(os.path.join(in_dir, META), encoding='utf-8') as fh:
+        info = json.load(fh)
+    mode = 'r' if mmap else None
+
+    def load(name):
+        return NP.load(os.path.join(in_dir, name), mmap_mode=mode)
+
+    if info['kind'] == 'csr':
+        X = SPS.csr_matrix((load('data.npy'), load('indices.npy'), load('indptr.npy')),
+                           shape=tuple(info['shape']), copy=False)
+    else:
+        X = load('X.npy')
+    labels = load('labels.npy') if info['labels'] else None
+    return X, labels, info
@@ -0,0 +1,168 @@
+# coding: utf-8
+
+"""
+streaming feature scaling: column means & variances accumulated chunk
+by chunk (Welford/Chan pairwise merging), so the data matrix never has
+to be in memory at once, & saved so the same transform can be applied
+at inference time
+"""
+
+import numpy as NP
+from scipy import sparse as SPS
+
+
+# a constant column's variance comes out of the float64 sums as the
+# square of the rounding error in its mean, ~(k * eps * mean) ** 2 for
+# k a few thousand at most, rather than 0: variances up to VAR_RTOL *
+# max(mean ** 2, 1) are taken as zero
+VAR_RTOL = 1e-20
+
+
+def _chunk_stats(X):
+    """
+    returns: (n, mean, m2) 3-tuple for one chunk: number of rows, &
+        float64 column means & sums of squared deviations from them
+    pass in: 2D NumPy array or scipy.sparse matrix
+    """
+    n = X.shape[0]
+    if not n:
+        return 0, NP.zeros(X.shape[1]), NP.zeros(X.shape[1])
+    if SPS.issparse(X):
+        X = SPS.csc_matrix(X)
+        X.sum_duplicates()
+        mean = NP.asarray(X.sum(axis=0), dtype=NP.float64).ravel() / n
+        # deviations of the stored values, plus the implicit zeros
+        cols = NP.repeat(NP.arange(X.shape[1]), NP.diff(X.indptr))
+        dev = X.data.astype(NP.float64) - mean[cols]
+        m2 = NP.bincount(cols, weights=dev * dev, minlength=X.shape[1])
+        m2 += (n - NP.diff(X.indptr)) * mean * mean
+        return n, mean, m2
+    X = NP.asarray(X, dtype=NP.float64)
+    mean = X.mean(axis=0)
+    return n, mean, ((X - mean) ** 2).sum(axis=0)
+
+
+class StandardScaler:
+    """
+    per-column standardization, (x - mean) / std, w/ statistics that
+    can be accumulated over any number of chunks via partial_fit
+
+    pass in:
+        with_mean: subtract the column means, default is True; must be
+            False for sparse input, as centering fills in every zero
+            (scale-only mode, which keeps a sparse matrix sparse)
+        with_std: divide by the column standard deviations, default is
+            True; constant columns (see 'constant') are left unscaled
+        dtype: dtype of transformed data, eg, float32 to halve memory;
+            statistics are always accumulated in float64
+    """
+
+    def __init__(self, with_mean=True, with_std=True, dtype=NP.float64):
+        self.with_mean = with_mean
+        self.with_std = with_std
+        self.dtype = NP.dtype(dtype)
+        self.n_samples = 0
+        self.mean = None
+        self.m2 = None
+
+    def partial_fit(self, X):
+        """
+        returns: self, w/ the rows of X merged into the statistics
+        pass in: one chunk of rows, 2D NumPy array or scipy.sparse matrix
+        """
+        n_b, mean_b, m2_b = _chunk_stats(X)
+        if self.mean is None:
+            self.n_samples, self.mean, self.m2 = n_b, mean_b, m2_b
+            return self
+        n_a = self.n_samples
+        n = n_a + n_b
+        if n_b:
+            # Chan et al.: pairwise merge of two (n, mean, m2) summaries
+            delta = mean_b - self.mean
+            self.mean = self.mean + delta * (n_b / n)
+            self.m2 = self.m2 + m2_b + delta * delta * (n_a * n_b / n)
+            self.n_samples = n
+        return self
+
+    def fit(self, X, chunk_size=2**14):
+        """
+        returns: self, fit afresh to all rows of X
+        pass in: 2D NumPy array (or memmap) or scipy.sparse matrix, read
+            chunk_size rows at a time
+        """
+        self.n_samples, self.mean, self.m2 = 0, None, None
+        for i in range(0, max(X.shape[0], 1), chunk_size):
+            self.partial_fit(X[i:i + chunk_size])
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.n_samples if self.n_samples else NP.zeros_like(self.m2)
+
+    @property
+    def constant(self):
+        """
+        returns: 1D bool array, True for the columns of zero variance, up
+            to rounding (see VAR_RTOL)
+        """
+        return self.var <= VAR_RTOL * NP.maximum(self.mean * self.mean, 1.)
+
+    @property
+    def scale(self):
+        """
+        returns: 1D array of column divisors: the standard deviations, w/
+            those of constant columns replaced by 1, or all 1s if with_std
+            is False
+        """
+        if not self.with_std:
+            return NP.ones_like(self.mean)
+        return NP.where(self.constant, 1., NP.sqrt(self.var))
+
+    def transform(self, X, copy=True):
+        """
+        returns: standardized X, of dtype self.dtype; sparse in, sparse out
+        pass in: 2D NumPy array or scipy.sparse matrix, & if copy is
+            False, a dense X of dtype self.dtype is scaled in place
+        """
+        assert self.mean is not None, "call fit, partial_fit (or load) first"
+        scale = self.scale.astype(self.dtype)
+        if SPS.issparse(X):
+            if self.with_mean:
+                raise ValueError("centering would densify sparse input; use with_mean=False")
+            X = SPS.csr_matrix(X, dtype=self.dtype, copy=True)
+            X.data /= scale[X.indices]
+            return X
+        X = NP.array(X, dtype=self.dtype, copy=copy or None)
+        if self.with_mean:
+            X -= self.mean.astype(self.dtype)
+        X /= scale
+        return X
+
+    def fit_transform(self, X, chunk_size=2**14, copy=True):
+        return self.fit(X, chunk_size).transform(X, copy)
+
+    def inverse_transform(self, X):
+        """
+        returns: X mapped back to the original units
+        """
+        X = X.multiply(self.scale).tocsr() if SPS.issparse(X) else X * self.scale
+        return X + self.mean if self.with_mean else X
+
+    def save(self, file_path):
+        """
+        returns: nothing; writes the statistics & options to one .npz file
+        """
+        assert self.mean is not None, "nothing to save: call fit first"
+        NP.savez(file_path, n_samples=self.n_samples, mean=self.mean, m2=self.m2,
+                 with_mean=self.with_mean, with_std=self.with_std, dtype=self.dtype.str)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        returns: a fitted StandardScaler
+        pass in: path to a file written by StandardScaler.save
+        """
+        with NP.load(file_path) as f:
+            sc = cls(bool(f['with_mean']), bool(f['with_std']), str(f['dtype']))
+            sc.n_samples, sc.mean, sc.m2 = int(f['n_samples']), f['mean'], f['m2']
+        return sc
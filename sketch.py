@@ -0,0 +1,248 @@
+# coding: utf-8
+
+"""
+bounded-memory approximate term counting: a Count-Min sketch estimates
+any term's count & a SpaceSaving summary tracks the heavy hitters, one
+pair per class, so memory is fixed no matter how many one-off tokens &
+typos the corpus holds
+"""
+
+import sys
+import math
+import heapq
+import hashlib
+
+import numpy as NP
+
+
+def term_hashes(terms):
+    """
+    returns: (h1, h2) 2-tuple of 1D uint64 arrays, two independent
+        64-bit hashes per term
+    pass in: sequence of terms (str)
+    blake2b rather than hash(), so the values are the same in every
+        process & sketches built in different workers can be compared
+    """
+    digests = b''.join(hashlib.blake2b(t.encode('utf-8'), digest_size=16).digest()
+                       for t in terms)
+    h = NP.frombuffer(digests, dtype=NP.uint64).reshape(-1, 2)
+    return h[:, 0], h[:, 1] | NP.uint64(1)
+
+
+class CountMinSketch:
+    """
+    depth x width table of int64 counters; each term increments one
+    counter per row & its estimate is the minimum of those counters,
+    so estimates never undercount & overcount by at most eps * N w/
+    probability 1 - delta, where eps = e / width, delta = e ** -depth
+    & N is the total count added
+
+    pass in: width & depth of the table
+    """
+
+    def __init__(self, width=2**16, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = NP.zeros((depth, width), dtype=NP.int64)
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, eps=1e-4, delta=1e-3):
+        """
+        returns: CountMinSketch sized for the requested error bounds
+        pass in: relative error eps & failure probability delta
+        """
+        return cls(int(math.ceil(math.e / eps)), int(math.ceil(math.log(1 / delta))))
+
+    def _cells(self, terms):
+        # double hashing: row i uses h1 + i * h2 (mod width)
+        h1, h2 = term_hashes(terms)
+        rows = NP.arange(self.depth, dtype=NP.uint64)[:, None]
+        cols = (h1[None, :] + rows * h2[None, :]) % NP.uint64(self.width)
+        return rows.astype(NP.int64) * self.width + cols.astype(NP.int64)
+
+    def add(self, terms):
+        """
+        returns: nothing
+        pass in: sequence of terms, one increment per occurrence
+        """
+        if len(terms):
+            NP.add.at(self.table.ravel(), self._cells(terms).ravel(), 1)
+            self.total += len(terms)
+
+    def estimate(self, terms):
+        """
+        returns: 1D int64 array, the estimated count of each term
+        """
+        if not len(terms):
+            return NP.zeros(0, dtype=NP.int64)
+        return self.table.ravel()[self._cells(terms)].min(axis=0)
+
+    def error_bound(self):
+        """
+        returns: (eps * N, delta) 2-tuple: an estimate exceeds the true
+            count by more than eps * N w/ probability at most delta
+        """
+        return math.e / self.width * self.total, math.exp(-self.depth)
+
+    def nbytes(self):
+        return self.table.nbytes
+
+
+class SpaceSaving:
+    """
+    the SpaceSaving heavy-hitter summary (Metwally et al.): at most
+    'capacity' terms are monitored, each w/ a count & an error; when a
+    new term arrives & the summary is full, it replaces the term w/ the
+    smallest count & inherits that count as its error, so a reported
+    count overcounts by at most its error, & error <= N / capacity
+
+    pass in: number of terms to monitor
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # min-heap of (count, term); entries go stale as counts grow &
+        # are refreshed lazily when they reach the top
+        self._heap = []
+        self.total = 0
+
+    def _pop_min(self):
+        while True:
+            c, t = heapq.heappop(self._heap)
+            if self.counts.get(t) == c:
+                return c, t
+            if t in self.counts:
+                heapq.heappush(self._heap, (self.counts[t], t))
+
+    def add(self, terms):
+        """
+        returns: nothing
+        pass in: sequence of terms, one increment per occurrence
+        """
+        counts, errors = self.counts, self.errors
+        for t in terms:
+            if t in counts:
+                counts[t] += 1
+            elif len(counts) < self.capacity:
+                counts[t], errors[t] = 1, 0
+                heapq.heappush(self._heap, (1, t))
+            else:
+                c, old = self._pop_min()
+                del counts[old], errors[old]
+                counts[t], errors[t] = c + 1, c
+                heapq.heappush(self._heap, (c + 1, t))
+        self.total += len(terms)
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, t) for t, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def top_k(self, k):
+        """
+        returns: python list of (count, term, error) 3-tuples, the k
+            largest monitored counts, count descending, ties broken by
+            term; the true count lies in [count - error, count]
+        """
+        top = heapq.nsmallest(k, self.counts.items(), key=lambda tc: (-tc[1], tc[0]))
+        return [(c, t, self.errors[t]) for t, c in top]
+
+    def error_bound(self):
+        """
+        returns: the largest possible overcount of any reported term
+        """
+        return self.total // self.capacity if self.capacity else self.total
+
+    def nbytes(self):
+        # containers plus the monitored terms; the ints are small & shared
+        return (sys.getsizeof(self.counts) + sys.getsizeof(self.errors) +
+                sys.getsizeof(self._heap) + 64 * len(self._heap) +
+                sum(sys.getsizeof(t) for t in self.counts))
+
+
+class ApproxTermCounter:
+    """
+    fixed-memory replacement for per-class exact term counts: one
+    CountMinSketch & one SpaceSaving summary per class label
+
+    pass in:
+        width, depth: CountMinSketch table shape
+        capacity: number of heavy hitters monitored per class
+    """
+
+    def __init__(self, width=2**16, depth=4, capacity=1000):
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.sketches = {}
+        self.heavy = {}
+
+    def _class(self, label):
+        if label not in self.sketches:
+            self.sketches[label] = CountMinSketch(self.width, self.depth)
+            self.heavy[label] = SpaceSaving(self.capacity)
+        return self.sketches[label], self.heavy[label]
+
+    def add(self, tokens, label):
+        """
+        returns: nothing
+        pass in: python list of terms (one data instance) & its label
+        """
+        cms, ss = self._class(label)
+        cms.add(tokens)
+        ss.add(tokens)
+
+    def add_stream(self, pairs, batch_size=2**16):
+        """
+        returns: nothing
+        pass in: iterable of (tokens, label) 2-tuples, eg, read_corpus;
+            tokens are buffered per class & hashed batch_size at a time
+        """
+        buf = {}
+        for tokens, label in pairs:
+            b = buf.setdefault(label, [])
+            b.extend(tokens)
+            if len(b) >= batch_size:
+                self.add(b, label)
+                buf[label] = []
+        for label, b in buf.items():
+            self.add(b, label)
+
+    def top_k(self, label, k=100):
+        """
+        returns: python list of (count, term) 2-tuples, in the same form
+            as the notebooks' 'term_count_1_sorted'; each count is the
+            smaller of the SpaceSaving & Count-Min estimates, both of
+            which only ever overcount
+        """
+        cms, ss = self._class(label)
+        top = ss.top_k(k)
+        est = cms.estimate([t for _, t, _ in top])
+        res = [(min(c, int(e)), t) for (c, t, _), e in zip(top, est)]
+        return sorted(res, key=lambda ct: (-ct[0], ct[1]))
+
+    def estimate(self, label, terms):
+        """
+        returns: 1D int64 array of Count-Min estimates for terms
+        """
+        return self._class(label)[0].estimate(terms)
+
+    def error_bounds(self, label):
+        """
+        returns: dict of the error guarantees for one class:
+            'cms_overcount': eps * N, exceeded w/ probability 'cms_delta'
+            'heavy_overcount': N / capacity, a hard bound
+            'total': N, the number of tokens counted
+        """
+        cms, ss = self._class(label)
+        eps_n, delta = cms.error_bound()
+        return {'cms_overcount': eps_n, 'cms_delta': delta,
+                'heavy_overcount': ss.error_bound(), 'total': cms.total}
+
+    def nbytes(self):
+        """
+        returns: approximate memory footprint, fixed by the configuration
+            & number of classes, not by the vocabulary size
+        """
+        return sum(cms.nbytes() + self.heavy[c].nbytes() for c, cms in self.sketches.items())
@@ -0,0 +1,133 @@
+# coding: utf-8
+
+"""
+shuffling & train/test/k-fold splitting by permutation index: the data
+& class labels are never stacked together, & row gathers can be
+deferred, so peak memory stays at one copy of the data
+"""
+
+import numpy as NP
+
+
+def get_rng(rng=None):
+    """
+    returns: a NumPy Generator
+    pass in: None (fresh entropy), an int seed, or a Generator (returned
+        as is); replaces the global NP.random.seed(0)
+    """
+    if isinstance(rng, NP.random.Generator):
+        return rng
+    return NP.random.default_rng(rng)
+
+
+def shuffle_index(n, rng=None):
+    """
+    returns: 1D int64 array, a random permutation of range(n)
+    pass in: number of rows & an rng (see get_rng)
+    """
+    return get_rng(rng).permutation(n)
+
+
+def train_test_indices(n, train_test_ratio=.9, rng=None, shuffle=True):
+    """
+    returns: (idx_tr, idx_te) 2-tuple of row index arrays
+    pass in:
+        number of rows;
+        train:test ratio: 0 < f < 1, default is 0.9;
+        an rng (see get_rng);
+        shuffle: if False, the two index arrays are contiguous ranges,
+            & take_rows returns views rather than copies
+    """
+    q = int(NP.ceil(train_test_ratio * n))
+    if not shuffle:
+        return NP.arange(q), NP.arange(q, n)
+    idx = shuffle_index(n, rng)
+    return idx[:q], idx[q:]
+
+
+def kfold_indices(n, k=10, rng=None, shuffle=True):
+    """
+    returns: generator of k (idx_tr, idx_te) 2-tuples; each row is in
+        exactly one test fold
+    pass in: number of rows, number of folds, an rng (see get_rng)
+    """
+    idx = shuffle_index(n, rng) if shuffle else NP.arange(n)
+    folds = NP.array_split(idx, k)
+    for i in range(k):
+        yield NP.concatenate(folds[:i] + folds[i + 1:]), folds[i]
+
+
+def take_rows(data, idx):
+    """
+    returns: the rows of data selected by idx; a view (no copy) when idx
+        is a contiguous ascending range, a gathered copy otherwise
+    pass in: 2D NumPy array (or 1D labels) & a 1D row index array
+    """
+    idx = NP.asarray(idx)
+    if idx.size and idx[-1] - idx[0] == idx.size - 1 and (NP.diff(idx) == 1).all():
+        return data[idx[0]:idx[-1] + 1]
+    return data[idx]
+
+
+class RowGather:
+    """
+    lazy row selection: holds a reference to the data & a row index
+    array, & only gathers rows when asked, a batch at a time or all at
+    once (NP.asarray(rg))
+
+    pass in: 2D NumPy array (or memmap) & 1D row index array
+    """
+
+    def __init__(self, data, idx):
+        self.data = data
+        self.idx = NP.asarray(idx)
+
+    def __len__(self):
+        return self.idx.shape[0]
+
+    @property
+    def shape(self):
+        return (self.idx.shape[0],) + self.data.shape[1:]
+
+    def __getitem__(self, i):
+        return take_rows(self.data, self.idx[i]) if isinstance(i, slice) else self.data[self.idx[i]]
+
+    def __array__(self, dtype=None, copy=None):
+        res = take_rows(self.data, self.idx)
+        return res if dtype is None else res.astype(dtype)
+
+    def iter_batches(self, batch_size=4096):
+        """
+        returns: generator of row blocks, each a gathered 2D array of at
+            most batch_size rows
+        """
+        for k in range(0, len(self), batch_size):
+            yield take_rows(self.data, self.idx[k:k + batch_size])
+
+
+def partition_data(data, class_labels, train_test_ratio=.9, rng=0, shuffle=True, lazy=False):
+    """
+    returns: data & class labels, split into training and test groups,
+        as 2 x 2-tuples;
+        these 2 containers are suitable to pass to scikit-learn classifier
+        objects
+        to call their 'fit' method, pass in *tr;
+        for 'predict', pass in te[0];
+        for 'score' pass in *te
+    pass in:
+        data, 2D NumPy array
+        class labels, 1D NumPy array (kept at its own dtype)
+        train:test ratio: 0 < f < 1, default is 0.9
+        rng: seed or Generator (see get_rng), default is 0
+        shuffle: if False, split in row order & return views
+        lazy: if True, return RowGather objects in place of the two
+            data arrays
+    only index arrays are permuted: the data is gathered once into the
+        two partitions (or not at all if lazy or shuffle is False)
+    """
+    idx_tr, idx_te = train_test_indices(data.shape[0], train_test_ratio, rng, shuffle)
+    L = NP.squeeze(class_labels)
+    L_tr, L_te = take_rows(L, idx_tr), take_rows(L, idx_te)
+    if lazy:
+        return (RowGather(data, idx_tr), L_tr), (RowGather(data, idx_te), L_te)
+    return (take_rows(data, idx_tr), L_tr), (take_rows(data, idx_te), L_te)
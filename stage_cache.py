@@ -0,0 +1,134 @@
+# coding: utf-8
+
+"""
+on-disk cache for the output of each pre-processing stage, so a notebook
+rerun resumes from the latest stage whose inputs & config are unchanged
+"""
+
+import os
+import json
+import hashlib
+
+from corpus_io import read_corpus, fingerprint
+from encoded_corpus import EncodedCorpus
+
+
+def cache_key(*parts):
+    """
+    returns: hex digest identifying one stage output
+    pass in: any JSON-serializable values: file fingerprints, stage
+        configs, the key of the upstream stage
+    """
+    blob = json.dumps(parts, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(blob).hexdigest()
+
+
+class StageCache:
+    """
+    directory of EncodedCorpus files, one per (stage, key); least
+    recently used entries are evicted once the directory exceeds
+    max_bytes
+
+    pass in:
+        cache_dir: directory to hold the cached stage outputs, created
+            if it does not exist
+        max_bytes: size limit for the directory, default is 4 GB
+    """
+
+    suffix = '.npz'
+
+    def __init__(self, cache_dir, max_bytes=2**32):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, stage, key):
+        return os.path.join(self.cache_dir, '{0}-{1}{2}'.format(stage, key, self.suffix))
+
+    def get(self, stage, key):
+        """
+        returns: the cached EncodedCorpus, or None on a miss
+        a hit refreshes the entry's mtime, which is what eviction orders by
+        """
+        fp = self.path(stage, key)
+        if not os.path.exists(fp):
+            return None
+        os.utime(fp)
+        return EncodedCorpus.load(fp)
+
+    def put(self, stage, key, corpus):
+        """
+        returns: nothing; writes corpus then evicts down to max_bytes
+        """
+        fp = self.path(stage, key)
+        tmp = fp + '.tmp'
+        corpus.save(tmp)
+        os.replace(tmp, fp)
+        self.evict(keep=fp)
+
+    def entries(self):
+        """
+        returns: list of (mtime, size, path) 3-tuples, oldest first
+        """
+        res = []
+        for fn in os.listdir(self.cache_dir):
+            if fn.endswith(self.suffix):
+                st = os.stat(os.path.join(self.cache_dir, fn))
+                res.append((st.st_mtime, st.st_size, os.path.join(self.cache_dir, fn)))
+        return sorted(res)
+
+    def evict(self, keep=None):
+        """
+        returns: list of paths removed
+        pass in: optional path never to evict (the entry just written)
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, fp in entries:
+            if total <= self.max_bytes:
+                break
+            if fp == keep:
+                continue
+            os.remove(fp)
+            total -= size
+            removed.append(fp)
+        return removed
+
+    def clear(self):
+        for _, _, fp in self.entries():
+            os.remove(fp)
+
+
+def cached_preprocess(data_file, labels_file, tokenize, cache, min_doc_len=11, read=read_corpus):
+    """
+    returns: EncodedCorpus of the documents having at least min_doc_len
+        tokens, w/ their class labels
+    pass in:
+        (i) absolute path to the data file;
+        (ii) absolute path to the class labels file;
+        (iii) a text_prep.Tokenizer (its config() is part of the key);
+        (iv) a StageCache;
+        (v) fewest tokens a document needs to be kept, default is 11
+            (ie, the notebooks' 'lx > 10');
+        (vi) the reader, read_corpus (the default) or, to tokenize
+            across a process pool, corpus_io.read_corpus_parallel; both
+            yield the same stream, so the reader is not part of the key
+    two stages are cached: 'tokens' (read, normalize, stop words, word
+        length, stem), keyed by both files' fingerprints & the tokenizer
+        config, & 'docs' (document length filter), keyed by the 'tokens'
+        key & min_doc_len; each run starts from the latest stage found
+    """
+    k_tokens = cache_key(fingerprint(data_file), fingerprint(labels_file),
+                         tokenize.config())
+    k_docs = cache_key(k_tokens, {'min_doc_len': min_doc_len})
+    corpus = cache.get('docs', k_docs)
+    if corpus is not None:
+        return corpus
+    corpus = cache.get('tokens', k_tokens)
+    if corpus is None:
+        corpus = EncodedCorpus.from_stream(read(data_file, labels_file, tokenize))
+        cache.put('tokens', k_tokens, corpus)
+    corpus = corpus.subset(corpus.doc_lengths() >= min_doc_len)
+    cache.put('docs', k_docs, corpus)
+    return corpus
@@ -0,0 +1,154 @@
+# coding: utf-8
+
+"""
+term statistics over an integer-encoded corpus: per-class term counts
+& document frequencies as (num_classes x vocab) arrays, computed w/
+bincount rather than a python loop over a flattened word list
+"""
+
+import heapq
+import collections as CL
+
+import numpy as NP
+
+
+def term_counter(word_bag):
+    """
+    returns: dict whose keys are terms and values are absolute counts
+        for that term
+    pass in: python list of terms
+    """
+    term_counter = CL.defaultdict(int)
+    for term in word_bag:
+        term_counter[term] += 1
+    return term_counter
+
+
+def top_k_ids(counts, k):
+    """
+    returns: 1D int64 array of the offsets of the (at most) k largest
+        non-zero counts, ordered by count descending, ties broken by
+        ascending offset (ie, term id)
+    pass in: 1D array of counts indexed by term id & k
+    argpartition finds the k-th count in O(V); only the (fewer than k)
+    terms strictly above it are sorted
+    """
+    counts = NP.asarray(counts)
+    k = min(k, counts.shape[0])
+    if k <= 0:
+        return NP.zeros(0, dtype=NP.int64)
+    kth = max(counts[NP.argpartition(-counts, k - 1)[k - 1]], 1)
+    above = NP.flatnonzero(counts > kth)
+    above = above[NP.lexsort((above, -counts[above]))]
+    # the terms tied w/ the k-th count fill the rest, lowest ids first:
+    # flatnonzero is already in id order, so they need no sort, & the
+    # result doesn't depend on which of them argpartition picked
+    tied = NP.flatnonzero(counts == kth)[:k - above.shape[0]]
+    return NP.concatenate((above, tied)).astype(NP.int64, copy=False)
+
+
+def top_k_dict(term_counts, k):
+    """
+    returns: python list of (count, term) 2-tuples, the k most frequent
+        terms, ordered by count descending, ties broken by term ascending
+    pass in: dict whose keys are terms and values are counts (eg, the
+        dict returned by term_counter) & k
+    a size-k heap over the items: O(V log k), no full sort
+    """
+    top = heapq.nsmallest(k, term_counts.items(), key=lambda tc: (-tc[1], tc[0]))
+    return [(c, t) for t, c in top]
+
+
+class TermCounts:
+    """
+    per-class term statistics for an EncodedCorpus
+
+    attributes:
+        classes: 1D array of the class labels, in row order
+        counts: (num_classes x vocab) int64 array, occurrences of each
+            term in the documents of each class
+        doc_freq: (num_classes x vocab) int64 array, number of documents
+            of each class that contain each term
+        n_docs: 1D int64 array, number of documents in each class
+        vocab: the corpus' Vocabulary
+    """
+
+    def __init__(self, classes, counts, doc_freq, n_docs, vocab):
+        self.classes = NP.asarray(classes)
+        self.counts = counts
+        self.doc_freq = doc_freq
+        self.n_docs = n_docs
+        self.vocab = vocab
+
+    @classmethod
+    def from_corpus(cls, corpus, classes=None):
+        """
+        returns: TermCounts
+        pass in:
+            (i) an EncodedCorpus
+            (ii) optional sequence of class labels fixing the row order
+                (& including classes absent from this corpus), default
+                is the sorted labels present
+        both arrays come from one pass over the token ids: each token is
+            keyed by (document, term); bincount of the key's class & term
+            gives the counts, & the distinct keys give document frequencies
+        """
+        V = len(corpus.vocab)
+        if classes is None:
+            classes = NP.unique(corpus.labels)
+        classes = NP.asarray(classes)
+        C = classes.shape[0]
+        # class row of each document, then of each token
+        order = NP.argsort(classes)
+        pos = NP.searchsorted(classes[order], corpus.labels)
+        row = order[NP.minimum(pos, max(C - 1, 0))]
+        assert (classes[row] == corpus.labels).all(), "corpus has labels not in classes"
+        doc = corpus.doc_ids()
+        tokens = corpus.tokens.astype(NP.int64)
+        counts = NP.bincount(row[doc] * V + tokens, minlength=C * V).reshape(C, V)
+        # distinct (document, term) pairs, one per document containing the term
+        pairs = NP.unique(doc * V + tokens)
+        doc_freq = NP.bincount(row[pairs // V] * V + pairs % V, minlength=C * V).reshape(C, V)
+        n_docs = NP.bincount(row, minlength=C)
+        return cls(classes, counts, doc_freq, n_docs, corpus.vocab)
+
+    def class_row(self, label):
+        """
+        returns: row offset of label in counts & doc_freq
+        """
+        return int(NP.flatnonzero(self.classes == label)[0])
+
+    def total(self):
+        """
+        returns: 1D int64 array, counts summed over all classes
+        """
+        return self.counts.sum(axis=0)
+
+    def term_counter(self, label=None):
+        """
+        returns: dict whose keys are terms and values are absolute counts
+            for that term--the same defaultdict the notebooks'
+            term_counter returns
+        pass in: a class label, or None for counts over all classes
+        """
+        counts = self.total() if label is None else self.counts[self.class_row(label)]
+        nz = NP.flatnonzero(counts)
+        tc = CL.defaultdict(int)
+        tc.update(zip(self.vocab.decode(nz), counts[nz].tolist()))
+        return tc
+
+    def top_k(self, label=None, k=100, ks=None):
+        """
+        returns: python list of (count, term) 2-tuples, the k most
+            frequent terms, in the same form as the notebooks'
+            'term_count_1_sorted' (but w/o the full sort); if ks is
+            given, a dict mapping each k in ks to its list instead, all
+            served from one selection
+        pass in: a class label (None for all classes), k or a sequence ks
+        """
+        counts = self.total() if label is None else self.counts[self.class_row(label)]
+        ids = top_k_ids(counts, max(ks) if ks else k)
+        top = list(zip(counts[ids].tolist(), self.vocab.decode(ids)))
+        if ks:
+            return {q: top[:q] for q in ks}
+        return top
@@ -94,98 +94,64 @@ data_file = os.path.join(PROJ_DIR, "data.txt")
 
 SW = stopwords.words('english')
 
-import re
-ptn_nwc = "[!#$%&'*+/=?`{|}~^.-]"
-ptn_nwc_obj = re.compile(ptn_nwc, re.MULTILINE)
-
-# open the two files
-# read them in
-# normalize: lower case the text 
-# remove end-of-line whitespace
-# remove punctuation
-# tokenize the lines
-
-with open(data_file, mode='r', encoding='utf-8') as fh:
-    d = ( ptn_nwc_obj.sub('', line.strip().lower()).split() 
-         for line in fh.readlines() )
-
-with open(labels_file, mode='r', encoding='utf-8') as fh:
-    l = [ int(line.strip()) for line in fh.readlines() ]    
-    
-# remove 'stop words' (using the NLTK set) &
-# remove words comprised of three letters or fewer
-d = (filter(lambda v: (v not in SW) & (len(v) > 4), line) for line in d)
-d = deepcopy([list(line) for line in d])
-
-# remove frequent terms common to all mobile apps:
-# (generated by scraping the app summaries 
-# from AppData's 1000 most popular mobiles apps)
-DOMAIN_STOP_WORDS = ['android', 'free', 'iphone', 'twitter', 'download', 
-                      'feature', 'features', 'applications', 'application', 
-                      'user', 'users', 'version', 'versions', 'facebook', 
-                      'phone', 'available', 'using', 'information', 'provide',
-                      'include', 'every', 'device', 'mobile', 'friend',
-                      'different', 'please', 'simple', 'email', 'share', 'follow',
-                      'great', 'screen', 'provide', 'acces', 'first', 'sound', 'video',]
-                         
-d = (filter(lambda v: (v not in DOMAIN_STOP_WORDS), line) for line in d)
-
-# normalize: simple word stemming
-def stem(word):
-    if word.endswith('s'):
-        return word[:-1]
-    else:
-        return word
-
-d = (list(map(stem, line)) for line in d)
-
-d1 = deepcopy([list(line) for line in d])
-
-lx = NP.array([len(line) for line in d1])
-
-# ~ 75 lines have 10 words or fewer
-idx = lx > 10
-sum(-idx)
-
-# so (temporarily) filter lines having 10 words or fewer &
-# filter their corresponding class labels
-
-idx = idx.tolist()
-d = IT.compress(d1, idx)
-l = IT.compress(l, idx)
+from corpus_io import read_corpus_parallel
+from stage_cache import StageCache, cached_preprocess
+from text_prep import StopwordFilter, Tokenizer, CachedStemmer, SuffixStemmer
+
+# one pass per line: normalize (lower case the text, remove end-of-line 
+# whitespace, remove punctuation, tokenize), then remove 'stop words' 
+# (the NLTK set plus DOMAIN_STOP_WORDS, frequent terms common to all 
+# mobile apps), remove words comprised of four letters or fewer & 
+# apply simple word stemming
+sw_filter = StopwordFilter(SW, min_word_len=5)
+# (swap in PorterStemmer() for real stemming; the cache absorbs its cost)
+stemmer = CachedStemmer(SuffixStemmer())
+tokenize = Tokenizer(sw_filter, stemmer=stemmer)
+
+# stream the two files in lockstep (the reader raises if they differ
+# in length), tokenizing across a process pool (read_corpus_parallel;
+# pass read=read_corpus for one process), & encode the lines straight
+# into an EncodedCorpus (flat token-id, offset & label arrays), never
+# a list of lists of str;
+# ~ 75 lines have 10 words or fewer, so (temporarily) filter lines 
+# having 10 words or fewer & their corresponding class labels
+
+# both stages are cached on disk, keyed by the files' fingerprints & the
+# tokenizer's config: a rerun w/ unchanged inputs loads the corpus back
+# rather than re-tokenizing; each worker keeps its own stemmer cache
+cache = StageCache(os.path.join(PROJ_DIR, 'stage_cache'))
+corpus = cached_preprocess(data_file, labels_file, tokenize, cache, min_doc_len=11,
+                           read=read_corpus_parallel)
 
 
 # In[8]:
 
 # partition the data & class labels into class I and class 0
 
-d = deepcopy([list(line) for line in d])
-l = deepcopy([line for line in l])
+# shuffle the documents once, w/ an explicit rng rather than the global
+# NP.random state: every matrix built from the corpus below inherits
+# this row order, so nothing downstream shuffles (or copies) it again
+from splits import shuffle_index
 
-assert len(d) == len(l)
+rng = NP.random.default_rng(0)
+corpus = corpus.subset(shuffle_index(len(corpus), rng))
 
-# shuffle both containers
-idx = NP.random.permutation(NP.arange(len(d)))
-d, l = NP.array(d), NP.array(l, dtype='int8')
-d, l = d[idx], l[idx]
+# split by class: index arithmetic on the flat arrays, no (ragged)
+# object array of token lists
+L = corpus.labels
 
-L = NP.array(l)
-    
-idx1 = l==1
-idx0 = l==0
-d1, l1 = d[idx1], l[idx1]
-d0, l0 = d[idx0], l[idx0] 
+by_class = corpus.split_by_class()
+c1, c0 = by_class[1], by_class[0]
 
-assert d1.size == l1.size
-assert d0.size == l0.size
+assert len(c1) + len(c0) == len(corpus)
 
 
 # In[9]:
 
 # any differences in the size of the raw data instances by class?
 
-ld1 = NP.array([ len(line) for line in d1 ])
-ld0 = NP.array([ len(line) for line in d0 ])
+ld1 = c1.doc_lengths()
+ld0 = c0.doc_lengths()
 
 print("mean word length of class 1 instances: {0:.2f}".format(ld1.mean()))
 print("mean word length of class 0 instances: {0:.2f}".format(ld0.mean()))
@@ -193,34 +159,25 @@ print("mean word length of class 0 instances: {0:.2f}".format(ld0.mean()))
 
 # In[10]:
 
-# look at the data by class
-
-words_1 = [ word for line in d1 for word in line ]
-words_0 = [ word for line in d0 for word in line ]
-words_01 = [ word for line in d for word in line ]
+# look at the data by class: count terms by class in one vectorized
+# pass over the encoded corpus (no flattened word lists)
 
-import collections as CL
+from term_counts import TermCounts
 
-def term_counter(word_bag):
-    """
-    returns: dict whose keys are terms and values are absolute counts
-        for that term
-    pass in: python list of terms
-    """
-    term_counter = CL.defaultdict(int)
-    for term in word_bag:
-        term_counter[term] += 1
-    return term_counter
+tc = TermCounts.from_corpus(corpus)
 
-term_count_1 = term_counter(words_1)
-term_count_0 = term_counter(words_0)
-term_count_all = term_counter(words_01)
+term_count_1 = tc.term_counter(1)
+term_count_0 = tc.term_counter(0)
+term_count_all = tc.term_counter()
 
 
 # In[11]:
 
-term_count_1_sorted = sorted(zip(term_count_1.values(), term_count_1.keys()), reverse=True)
-term_count_0_sorted = sorted(zip(term_count_0.values(), term_count_0.keys()), reverse=True)
+# (count, term) pairs for the 100 most frequent terms in each class;
+# partial selection rather than a sort of the whole vocabulary,
+# & ties are broken by term id rather than by comparing strings
+term_count_1_sorted = tc.top_k(1, 100)
+term_count_0_sorted = tc.top_k(0, 100)
 
 
 # In[12]:
@@ -232,42 +189,11 @@ v1.extend(v0)
 
 # In[13]:
 
-def build_feature_vector(data, feature_vector):
-    """
-    returns: a structured 2D data array comprised of in which
-        each column encodes one discrete feature; each row
-        represents one data instance
-    pass in: 
-        (i) the data: a nested list in which each list is one data instance,
-            or 'bag of words';
-        (ii) a template feature vector: a list of terms, comprising a subset
-            of the population whose frequency will be counted to to supply
-            the values comprising each feature vector 
-    this fn transforms a sequence of word bags (each bag is a python list)
-        into a structured 1D NumPy array of features
-    """
-    import numpy as NP
-    import collections as CL
-    from copy import deepcopy
-    fv = set(feature_vector)
-    # maps each  most-frequent term to an offset in feature vector
-    term_vector_lut = { t:i for i, t in enumerate(fv) }
-    # remove all words from each line not in the feature_vector
-    d = (filter(lambda q: q in fv, line) for line in data)
-    d = deepcopy([list(line) for line in d])
-    # initialize the empty 2D NumPy array returned 
-    m, n = len(d), len(term_vector_lut)
-    D = NP.zeros((m, n))
-    dx = CL.defaultdict(int)
-    c = 0
-    for line in d:
-        new_row = NP.zeros(len(fv))
-        for w in line:
-            idx = term_vector_lut[w]
-            new_row[idx] += 1
-        D[c,:] = new_row
-        c += 1
-    return D
+# build_feature_vector fills the matrix w/o a per-row loop or per-row
+# allocation; pass sparse=True for a scipy.sparse CSR matrix & dtype=
+# to pick the value type; columns follow the order of the terms in the
+# feature vector
+from vectorize import build_feature_vector, CountVectorizer
 
 
 # In[14]:
@@ -280,7 +206,14 @@ v1.extend(v0)
 
 # In[15]:
 
-D = build_feature_vector(d, v1)
+# freeze the ordered vocabulary & persist it, so new descriptions can
+# be transformed at serving time into the same columns w/o a refit;
+# the tokenizer's config is saved too, & CountVectorizer.load(fp,
+# tokenize) raises if new text would be tokenized any other way
+vec = CountVectorizer().fit(v1, tokenize=tokenize)
+vec.save(os.path.join(PROJ_DIR, 'feature_vocab.json'))
+
+D = vec.transform(corpus)
 
 
 # In[16]:
@@ -307,13 +240,9 @@ for i, o in a10:
 
 # In[17]:
 
-# shuffle the data
-L = L.reshape(-1, 1)
-DL = NP.hstack((D, L))
-idx = NP.random.permutation(NP.arange(D.shape[0]))
-DL = DL[idx,]
-
-D, L = NP.hsplit(DL, [-1])
+# no shuffle of D & L here: their rows are already in random order
+# (the corpus was shuffled in In[8]), & a second permute-and-gather
+# would only copy D again
 
 
 ##### optimization I: add features comprised of frequently occurring _pairs_ of words
@@ -325,7 +254,8 @@ D, L = NP.hsplit(DL, [-1])
 t1 = [ t for cn, t in term_count_1_sorted[:25] ]
 t0 = [ t for cn, t in term_count_0_sorted[:25] ]
 
-fv = set(v1)
+# columns of D follow the order of first appearance in v1
+fv = list(dict.fromkeys(v1))
 
 tv_lut = { t:i for i, t in enumerate(fv) }
 
@@ -336,70 +266,76 @@ LuT_r = { i:t for i, t in enumerate(fv) }
 idx_ft1 = [ LuT[term] for term in t1 ]
 idx_ft0 = [ LuT[term] for term in t0 ]
 
-D, L = NP.hsplit(DL, [-1])
-L = L.squeeze()
+# presence/absence of each term, bit-packed 64 documents per word
+# (D itself keeps its counts; the classifier gets D > 0, see In[36])
+from incidence import BitIncidence
 
-D = NP.where(D>0, 1, 0)
-D = NP.array(D, dtype=bool)
+B = BitIncidence.from_dense(D)
 
 idx1 = L==1
-idx0 = L==0
 
 # class I instances
-D1 = D[idx1,]
+B1 = B.select_docs(idx1)
 
-#class 0 instances
-D0 = D[idx0,]
 
-# now select just those columns that represent a top 20 term
-DT1 = D1.T[idx_ft1,]
-DT0 = D0.T[idx_ft0,]
+# In[21]:
 
-# remap offsets in new arrays (DT1, DT2) to the offsets for the complete dataset
-lut_ft1, lut_ft0 = dict(enumerate(idx_ft1)), dict(enumerate(idx_ft0))
+# co-occurrence of every pair of the top class I terms, as one sparse
+# product (X^T X) rather than one python call per pair; offsets
+# returned are columns of D
 
+from cooccurrence import top_pairs, top_pairs_by_class
 
-# In[21]:
+C = top_pairs(B1, k=len(idx_ft1)**2, cols=idx_ft1)
 
-import itertools as IT
+for score, n, (i, j) in C:
+    print("{0}\t{1}".format(score, (LuT_r[i], LuT_r[j])))
 
-def cofreq_score(v1, v2):
-    """
-    returns: scalar that represents co-occurrence frequency
-    pass in: 2 x 1D NumPy arrays of dtype 'bool'
-    """
-    return NP.sum(v1 & v2)
 
+# In[22]:
 
-def prep(t, D=DT1):
-    """
-    returns: v1, v2 to pass to cofreq_score
-    pass in: 
-        (i) a tuple of offsets;
-        (ii) a transposed dataset as a 2D NumPy array
-    """
-    idx_v1, idx_v2 = t
-    return D[idx_v1], D[idx_v2]
+# the same, over all columns of D & for both classes, scored by PMI
+# (pairs in fewer than 20 documents of the class are skipped)
 
+C_pmi = top_pairs_by_class(B, L, k=25, score='pmi', min_count=20)
 
-# In[22]:
+for c in (1, 0):
+    for score, n, (i, j) in C_pmi[c]:
+        print("{0}\t{1:.3f}\t{2}\t{3}".format(c, score, n, (LuT_r[i], LuT_r[j])))
+
+
+# In[ ]:
 
-term_pair_offsets = IT.combinations(range(DT1.shape[0]), 2)
+# turn pairs into features: adjacent bigrams & the top co-occurring
+# pairs (each in 20+ documents) as extra sparse columns after the
+# unigram columns, filled in the same pass over the corpus
 
-C = [ ( cofreq_score(*prep(t)), t )  for i, t in enumerate(term_pair_offsets) ]
+from vectorize import PairVectorizer
 
-C = sorted(list(C), reverse=True)
-for score, t in C:
-    print("{0}\t{1}".format(score, t))
+pairs = [ (LuT_r[i], LuT_r[j]) for c in (1, 0) for _, _, (i, j) in C_pmi[c] ]
+
+pvec = PairVectorizer(max_bigrams=200).fit(corpus, v1, pairs=pairs, min_count=20,
+                                           tokenize=tokenize)
+pvec.save(os.path.join(PROJ_DIR, 'pair_feature_vocab.json'))
+
+# rows of corpus are in the order D was built in, so X_pairs lines up w/ D
+X_pairs = pvec.transform(corpus)
+print(X_pairs.shape, X_pairs.nnz)
 
 
 ##### optimization II: improve classifier accuracy by applying a weight vector to each feature vector
 
 # In[23]:
 
-term_count_1 = term_counter(words_1)
-term_count_0 = term_counter(words_0)
-term_count_all = term_counter(words_01)
+# weight vectors over the whole vocabulary, in one vectorized pass over
+# the per-class count arrays: (count in class + 1) / (count in the
+# other class + 1)
+
+from weighting import class_ratio_weights, idf_weights, column_weights
+from weighting import scale_columns, tfidf, bm25
+
+w1 = class_ratio_weights(tc, 1, alpha=1.)
+w0 = class_ratio_weights(tc, 0, alpha=1.)
 
 
 # In[24]:
@@ -409,23 +345,35 @@ term_top_20_class0 = a0[:20]
 
 # constructing the weight vector:
 
-for t in term_top_20_class1:
-    print("term: {0}\t weight: {1:.2f}".format(t[0], t[1]/term_count_0[t[0]]))
+ids = tc.vocab.encode((t[0] for t in term_top_20_class1), grow=False)
+for t, w in zip(term_top_20_class1, w1[ids]):
+    print("term: {0}\t weight: {1:.2f}".format(t[0], w))
 
 
 # In[25]:
 
 # the other portion of the weight vector:
 
-for t in term_top_20_class0:
-    print("term: {0}\t weight: {1:.2f}".format(t[0], t[1]/(term_count_1[t[0]]+1)))
+ids = tc.vocab.encode((t[0] for t in term_top_20_class0), grow=False)
+for t, w in zip(term_top_20_class0, w0[ids]):
+    print("term: {0}\t weight: {1:.2f}".format(t[0], w))
 
 
-# In[26]:
+# In[ ]:
+
+# apply the weights to the columns of D as a diagonal scaling; on the
+# sparse matrix only the stored values are touched
 
-words_1 = [ word for line in d1 for word in line ]
-words_0 = [ word for line in d0 for word in line ]
-words_01 = [ word for line in d for word in line ]
+from scipy import sparse as SPS
+
+X = SPS.csr_matrix(D)
+
+D_ratio = scale_columns(X, column_weights(w1, tc.vocab, vec.terms))
+D_tfidf = tfidf(X, column_weights(idf_weights(tc), tc.vocab, vec.terms))
+D_bm25 = bm25(X, column_weights(idf_weights(tc, 'bm25'), tc.vocab, vec.terms))
+
+
+# In[26]:
 
 a1 = [ (w, c) for c, w in term_count_1_sorted[:20] ]
 a0 = [ (w, c) for c, w in term_count_0_sorted[:20] ]
@@ -447,41 +395,10 @@ for i, o in a10:
 
 # In[32]:
 
-def partition_data(data, class_labels, train_test_ratio=.9):
-    """
-    returns: data & class labels, split into training and test groups,
-        as 2 x 2-tuples; 
-        these 2 containers are suitable to pass to scikit-learn classifier
-        objects
-        to call their 'fit' method, pass in *tr; 
-        for 'predict', pass in te[0];
-        for 'score' pass in *te
-    pass in: 
-        data, 2D NumPy array
-        class labels, 1D NumPy array
-        train:test ratio: 0 < f < 1, default is 0.9
-    bind the result returned from call to this fn to two variables, 
-        like so: tr, te = partition_data()
-        each variable represents a tuple comprised of data + labels
-    """
-    # create a vector that holds the row indices
-    NP.random.seed(0)
-    idx = NP.random.permutation(data.shape[0])
-    # now order both data and class labels arrays by idx
-    D = data[idx,]
-    L = class_labels[idx]
-    # allocate the data to test & train partitions according to
-    # the train_test_ratio passed in
-    q = int(NP.ceil(train_test_ratio * D.shape[0]))
-    D_tr = D[:q,:]
-    D_te = D[q:,:]
-    L_tr = L[:q]
-    L_te = L[q:]
-    assert D_tr.shape[0] + D_te.shape[0] == D.shape[0]
-    assert L_tr.shape[0] + L_te.shape[0] == L.shape[0]
-    # 1D array required by scikit-learn
-    L_tr, L_te = NP.squeeze(L_tr), NP.squeeze(L_te)
-    return (D_tr, L_tr), (D_te, L_te)
+# partition_data permutes an index array only: data & labels are
+# gathered once into the two partitions, labels keep their dtype, and
+# the rng is explicit rather than NP.random.seed(0)
+from splits import partition_data
 
 
 # In[33]:
@@ -506,7 +423,13 @@ from sklearn import naive_bayes as NB
 
 # In[36]:
 
-tr, te = partition_data(D, L)
+# the classifier is fit to presence/absence of each term, not the
+# counts D keeps for the weighting cells
+D_bool = D > 0
+
+# the rows are already shuffled: split in row order, so tr & te are
+# views of D_bool rather than copies
+tr, te = partition_data(D_bool, L, shuffle=False)
 
 
 # In[37]:
@@ -0,0 +1,358 @@
+# coding: utf-8
+
+"""
+token-level pre-processing of the raw corpus: stop word removal,
+word-length filtering & stemming, fused into a single pass per line
+"""
+
+import functools
+import hashlib
+
+from corpus_io import normalize
+
+
+# frequent terms common to all mobile apps:
+# (generated by scraping the app summaries
+# from AppData's 1000 most popular mobiles apps)
+DOMAIN_STOP_WORDS = ['android', 'free', 'iphone', 'twitter', 'download',
+                      'feature', 'features', 'applications', 'application',
+                      'user', 'users', 'version', 'versions', 'facebook',
+                      'phone', 'available', 'using', 'information', 'provide',
+                      'include', 'every', 'device', 'mobile', 'friend',
+                      'different', 'please', 'simple', 'email', 'share', 'follow',
+                      'great', 'screen', 'provide', 'acces', 'first', 'sound', 'video',]
+
+
+def stem(word):
+    """
+    returns: the word w/ one trailing 's' removed
+    pass in: a single term (str)
+    """
+    if word.endswith('s'):
+        return word[:-1]
+    else:
+        return word
+
+
+class Stemmer:
+    """
+    interface for the stemmers passed to Tokenizer: a subclass overrides
+    'stem'; instances are callable so they drop in wherever the plain
+    'stem' function was used
+    """
+
+    # bump in a subclass whenever its rules change, so cached output
+    # produced w/ the old rules is not reused
+    version = 1
+
+    def stem(self, word):
+        raise NotImplementedError
+
+    def __call__(self, word):
+        return self.stem(word)
+
+    def config(self):
+        """
+        returns: dict identifying the stemmer, for use in cache keys; a
+            subclass taking parameters adds them
+        """
+        cls = type(self)
+        return {'stemmer': '{0}.{1}'.format(cls.__module__, cls.__qualname__),
+                'version': self.version}
+
+
+def stemmer_config(stemmer):
+    """
+    returns: dict identifying a stemmer, for use in cache keys
+    pass in: a Stemmer, a module-level function (eg, 'stem') or another
+        callable object (eg, an NLTK stemmer), keyed by its class
+    raises ValueError for lambdas & nested functions: their names say
+        nothing about what they do, so output cached w/ one would be
+        reused for any other
+    """
+    if isinstance(stemmer, Stemmer):
+        return stemmer.config()
+    if not hasattr(stemmer, '__qualname__'):
+        stemmer = type(stemmer)
+    name = stemmer.__qualname__
+    if '<' in name:
+        raise ValueError("can't key a cache on stemmer {0!r}; use a module-level "
+                         "function or a Stemmer subclass".format(stemmer))
+    return {'stemmer': '{0}.{1}'.format(stemmer.__module__, name)}
+
+
+class SuffixStemmer(Stemmer):
+    """
+    the notebooks' original rule: strip one trailing 's'
+    """
+
+    def stem(self, word):
+        return stem(word)
+
+
+class PorterStemmer(Stemmer):
+    """
+    the Porter (1980) suffix-stripping algorithm, steps 1a through 5b;
+    more than an order of magnitude costlier per call than SuffixStemmer, so wrap it in a
+    CachedStemmer when used on the full corpus
+    """
+
+    _step2 = (('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'),
+              ('anci', 'ance'), ('izer', 'ize'), ('abli', 'able'),
+              ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous'),
+              ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'),
+              ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'),
+              ('ousness', 'ous'), ('aliti', 'al'), ('iviti', 'ive'),
+              ('biliti', 'ble'))
+    _step3 = (('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'),
+              ('ical', 'ic'), ('ful', ''), ('ness', ''))
+    _step4 = ('al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement',
+              'ment', 'ent', 'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize')
+
+    @staticmethod
+    def _cv(w):
+        # 'c'/'v' per letter; 'y' is a vowel only when it follows a consonant
+        p = []
+        for i, ch in enumerate(w):
+            if ch in 'aeiou':
+                p.append('v')
+            elif ch == 'y' and i > 0 and p[-1] == 'c':
+                p.append('v')
+            else:
+                p.append('c')
+        return ''.join(p)
+
+    def _m(self, w):
+        return self._cv(w).count('vc')
+
+    def _has_vowel(self, w):
+        return 'v' in self._cv(w)
+
+    def _double_cons(self, w):
+        return len(w) > 1 and w[-1] == w[-2] and self._cv(w)[-1] == 'c'
+
+    def _cvc(self, w):
+        return self._cv(w).endswith('cvc') and w[-1] not in 'wxy'
+
+    def _replace(self, w, rules, min_m):
+        # only the longest matching suffix is considered
+        best = None
+        for suffix, repl in rules:
+            if w.endswith(suffix) and (best is None or len(suffix) > len(best[0])):
+                best = (suffix, repl)
+        if best is not None:
+            base = w[:-len(best[0])]
+            if self._m(base) > min_m:
+                return base + best[1]
+        return w
+
+    def stem(self, word):
+        w = word
+        if len(w) <= 2:
+            return w
+        # step 1a
+        if w.endswith('sses') or w.endswith('ies'):
+            w = w[:-2]
+        elif w.endswith('s') and not w.endswith('ss'):
+            w = w[:-1]
+        # step 1b
+        tidy = False
+        if w.endswith('eed'):
+            if self._m(w[:-3]) > 0:
+                w = w[:-1]
+        elif w.endswith('ed') and self._has_vowel(w[:-2]):
+            w, tidy = w[:-2], True
+        elif w.endswith('ing') and self._has_vowel(w[:-3]):
+            w, tidy = w[:-3], True
+        if tidy:
+            if w.endswith(('at', 'bl', 'iz')):
+                w += 'e'
+            elif self._double_cons(w) and w[-1] not in 'lsz':
+                w = w[:-1]
+            elif self._m(w) == 1 and self._cvc(w):
+                w += 'e'
+        # step 1c
+        if w.endswith('y') and self._has_vowel(w[:-1]):
+            w = w[:-1] + 'i'
+        # steps 2 & 3
+        w = self._replace(w, self._step2, 0)
+        w = self._replace(w, self._step3, 0)
+        # step 4
+        suffixes = [sx for sx in self._step4 if w.endswith(sx)]
+        if suffixes:
+            sx = max(suffixes, key=len)
+            base = w[:-len(sx)]
+            if self._m(base) > 1 and (sx != 'ion' or base.endswith(('s', 't'))):
+                w = base
+        # step 5a
+        if w.endswith('e'):
+            m = self._m(w[:-1])
+            if m > 1 or (m == 1 and not self._cvc(w[:-1])):
+                w = w[:-1]
+        # step 5b
+        if self._m(w) > 1 and self._double_cons(w) and w.endswith('l'):
+            w = w[:-1]
+        return w
+
+
+class CachedStemmer(Stemmer):
+    """
+    bounded LRU cache in front of any stemmer; term frequencies are
+    Zipfian, so after warm-up nearly every call is a dict lookup &
+    the cost of the underlying algorithm barely matters
+
+    pass in:
+        stemmer: any callable mapping a term to its stem
+        maxsize: most terms held in the cache, default is 2**16
+    """
+
+    def __init__(self, stemmer, maxsize=2**16):
+        self.stemmer = stemmer
+        self.maxsize = maxsize
+        self._cached = functools.lru_cache(maxsize=maxsize)(stemmer)
+
+    def stem(self, word):
+        return self._cached(word)
+
+    __call__ = stem
+
+    def cache_info(self):
+        """
+        returns: functools' (hits, misses, maxsize, currsize) named tuple
+        """
+        return self._cached.cache_info()
+
+    @property
+    def hit_rate(self):
+        """
+        returns: fraction of calls answered from the cache
+        """
+        info = self._cached.cache_info()
+        n = info.hits + info.misses
+        return info.hits / n if n else 0.
+
+    def cache_clear(self):
+        self._cached.cache_clear()
+
+    def config(self):
+        # the cache doesn't change the output: key on what it wraps
+        return stemmer_config(self.stemmer)
+
+    def __getstate__(self):
+        # the lru_cache wrapper can't be pickled; each process starts cold
+        return {'stemmer': self.stemmer, 'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['stemmer'], state['maxsize'])
+
+
+def load_stop_words(file_path, encoding='utf-8'):
+    """
+    returns: python list of terms
+    pass in: path to a text file holding one stop word per line;
+        blank lines & lines beginning with '#' are skipped
+    """
+    with open(file_path, mode='r', encoding=encoding) as fh:
+        terms = (line.strip().lower() for line in fh)
+        return [t for t in terms if t and not t.startswith('#')]
+
+
+class StopwordFilter:
+    """
+    the stop word & word-length rules, backed by a single frozen hash set
+    so each membership test is O(1) rather than a scan of the NLTK list
+    (~150 terms) then DOMAIN_STOP_WORDS (~37 terms)
+
+    pass in:
+        stop_words: iterable of terms to remove (eg, the NLTK list)
+        min_word_len: shortest term kept, default is 5
+            (ie, the notebooks' 'len(v) > 4')
+        domain_stop_words: iterable of domain terms, default is
+            DOMAIN_STOP_WORDS
+        files: sequence of paths to additional stop word lists,
+            read w/ 'load_stop_words'
+    """
+
+    def __init__(self, stop_words=(), min_word_len=5,
+                 domain_stop_words=DOMAIN_STOP_WORDS, files=()):
+        terms = set(stop_words)
+        terms.update(domain_stop_words)
+        for file_path in files:
+            terms.update(load_stop_words(file_path))
+        self.terms = frozenset(terms)
+        self.min_word_len = min_word_len
+
+    def __contains__(self, term):
+        return term in self.terms
+
+    def __len__(self):
+        return len(self.terms)
+
+    def config(self):
+        """
+        returns: dict describing the filter, for use in cache keys
+        """
+        digest = hashlib.sha1('\n'.join(sorted(self.terms)).encode('utf-8'))
+        return {'stop_words': digest.hexdigest(), 'min_word_len': self.min_word_len}
+
+    def keep(self, term):
+        """
+        returns: True if term survives both the length & stop word rules
+        """
+        return len(term) >= self.min_word_len and term not in self.terms
+
+    def filter(self, tokens):
+        """
+        returns: python list of the tokens that survive
+        pass in: iterable of tokens (one data instance)
+        """
+        sw, n = self.terms, self.min_word_len
+        return [t for t in tokens if len(t) >= n and t not in sw]
+
+    def filter_batch(self, batch):
+        """
+        returns: python list of filtered token lists
+        pass in: iterable of token lists (many data instances)
+        """
+        sw, n = self.terms, self.min_word_len
+        return [[t for t in tokens if len(t) >= n and t not in sw]
+                for tokens in batch]
+
+
+class Tokenizer:
+    """
+    callable that maps one raw line to its list of surviving, stemmed
+    tokens; replaces the chain of regex sub -> filter(SW, len) ->
+    deepcopy -> filter(DOMAIN_STOP_WORDS) -> map(stem) -> deepcopy
+    with one list comprehension per line
+
+    pass in:
+        stop_words: a StopwordFilter, or an iterable of terms to remove
+            (eg, the NLTK list) from which one is built, in which case
+            DOMAIN_STOP_WORDS is always added
+        min_word_len: shortest term kept, default is 5; ignored if
+            stop_words is already a StopwordFilter
+        stemmer: callable applied to each surviving term, default
+            is 'stem'
+    """
+
+    def __init__(self, stop_words=(), min_word_len=5, stemmer=stem):
+        if not isinstance(stop_words, StopwordFilter):
+            stop_words = StopwordFilter(stop_words, min_word_len)
+        self.stop_filter = stop_words
+        self.stemmer = stemmer
+
+    def config(self):
+        """
+        returns: dict describing the tokenizer, for use in cache keys
+        raises ValueError if the stemmer can't be identified (see
+            stemmer_config)
+        """
+        cfg = self.stop_filter.config()
+        cfg['stemmer'] = stemmer_config(self.stemmer)
+        return cfg
+
+    def __call__(self, line):
+        sw, n = self.stop_filter.terms, self.stop_filter.min_word_len
+        st = self.stemmer
+        return [st(t) for t in normalize(line) if len(t) >= n and t not in sw]
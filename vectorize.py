@@ -0,0 +1,519 @@
+# coding: utf-8
+
+"""
+turning word bags into the structured data matrix: one row per data
+instance, one column per feature, dense or scipy.sparse CSR
+"""
+
+import os
+import zlib
+import json
+import hashlib
+import multiprocessing as MP
+
+import numpy as NP
+from scipy import sparse as SPS
+
+from corpus_io import line_chunks, read_chunk, normalize
+from encoded_corpus import EncodedCorpus
+from term_counts import top_k_ids
+
+
+def _csr_parts(data, terms, lut=None):
+    """
+    returns: (indptr, indices) 2-tuple of int64 arrays, the CSR structure
+        w/ one entry per kept token (duplicates not yet summed)
+    pass in: EncodedCorpus or nested list of terms, the column terms, &
+        optionally a prebuilt term -> column dict
+    """
+    if isinstance(data, EncodedCorpus):
+        # lut maps term id -> column, -1 for terms not in the feature vector
+        lut = NP.full(len(data.vocab), -1, dtype=NP.int64)
+        for col, term in enumerate(terms):
+            if term in data.vocab:
+                lut[data.vocab.index[term]] = col
+        cols = lut[data.tokens]
+        keep = cols >= 0
+        kept = NP.zeros(keep.shape[0] + 1, dtype=NP.int64)
+        NP.cumsum(keep, out=kept[1:])
+        return kept[data.offsets], cols[keep]
+    if lut is None:
+        lut = {t: i for i, t in enumerate(terms)}
+    indices, indptr = [], [0]
+    for line in data:
+        indices.extend(lut[w] for w in line if w in lut)
+        indptr.append(len(indices))
+    return NP.array(indptr, dtype=NP.int64), NP.array(indices, dtype=NP.int64)
+
+
+def build_feature_vector(data, feature_vector, sparse=False, dtype=NP.float64):
+    """
+    returns: a structured 2D data array in which each column encodes one
+        discrete feature; each row represents one data instance; a
+        scipy.sparse CSR matrix if sparse is True, else a NumPy array
+    pass in:
+        (i) the data: an EncodedCorpus, or a nested list in which each
+            list is one data instance, or 'bag of words';
+        (ii) a template feature vector: a list of terms, comprising a
+            subset of the population whose frequency will be counted to
+            supply the values comprising each feature vector; columns
+            follow the order of first appearance in this list
+        (iii) sparse: build a CSR matrix directly, w/o a dense
+            intermediate
+        (iv) dtype of the values, default is float64 (use eg int32 or
+            float32 to cut memory)
+    no per-row allocation: the CSR structure is built in one pass over
+        the tokens (one vectorized lookup for an EncodedCorpus), & the
+        dense matrix is allocated once, at dtype, & filled in place
+    """
+    terms = list(dict.fromkeys(feature_vector))
+    return _assemble(data, terms, sparse, dtype)
+
+
+def _assemble(data, terms, sparse, dtype, lut=None):
+    m, n = len(data), len(terms)
+    indptr, indices = _csr_parts(data, terms, lut)
+    if sparse:
+        X = SPS.csr_matrix((NP.ones(indices.shape[0], dtype=dtype), indices, indptr),
+                           shape=(m, n))
+        X.sum_duplicates()
+        return X
+    rows = NP.repeat(NP.arange(m, dtype=NP.int64), NP.diff(indptr))
+    return _dense_counts(rows, indices, (m, n), dtype)
+
+
+def _dense_counts(rows, cols, shape, dtype):
+    # the result is the only m x n allocation: no int64 counts array to
+    # convert, so a float32 dtype really does halve peak memory
+    D = NP.zeros(shape, dtype=dtype)
+    NP.add.at(D, (rows, cols), 1)
+    return D
+
+
+class CountVectorizer:
+    """
+    fit/transform wrapper around build_feature_vector: 'fit' freezes an
+    ordered vocabulary (column i is always terms[i], whatever the hash
+    seed or process), 'save' persists it, & 'transform' reuses it, so
+    scoring new descriptions at serving time is one dict lookup per token
+
+    pass in:
+        sparse: return scipy.sparse CSR matrices, default is False
+        dtype: value type, default is float64
+    """
+
+    def __init__(self, sparse=False, dtype=NP.float64):
+        self.sparse = sparse
+        self.dtype = NP.dtype(dtype)
+        self.terms = None
+        self.lut = None
+        self.tokenizer = None
+
+    def fit(self, feature_vector, tokenize=None):
+        """
+        returns: self
+        pass in: a template feature vector: a list of terms; duplicates
+            are dropped, keeping the first appearance; & the
+            text_prep.Tokenizer that produced the terms, whose config()
+            is saved w/ them (see load)
+        """
+        self.terms = list(dict.fromkeys(feature_vector))
+        self.lut = {t: i for i, t in enumerate(self.terms)}
+        self.tokenizer = tokenize.config() if tokenize is not None else None
+        return self
+
+    def fit_top_k(self, term_counts, k=50, classes=None, tokenize=None):
+        """
+        returns: self
+        pass in:
+            (i) a term_counts.TermCounts
+            (ii) k, the number of most frequent terms taken per class
+            (iii) classes whose top terms are used, in column order;
+                default is every class, descending (ie, the notebooks'
+                class I terms, then class 0)
+            (iv) the text_prep.Tokenizer, as in fit
+        """
+        classes = classes if classes is not None else sorted(term_counts.classes.tolist(), reverse=True)
+        fv = [t for c in classes for _, t in term_counts.top_k(c, k)]
+        return self.fit(fv, tokenize)
+
+    @property
+    def version(self):
+        """
+        returns: short hex digest of the ordered vocabulary; equal
+            versions mean identical columns
+        """
+        blob = '\n'.join(self.terms).encode('utf-8')
+        return hashlib.sha1(blob).hexdigest()[:16]
+
+    def transform(self, data):
+        """
+        returns: feature matrix, one row per data instance, one column
+            per vocabulary term
+        pass in: an EncodedCorpus, or a nested list of terms
+        """
+        assert self.terms is not None, "call fit (or load) first"
+        return _assemble(data, self.terms, self.sparse, self.dtype, self.lut)
+
+    def fit_transform(self, data, feature_vector):
+        return self.fit(feature_vector).transform(data)
+
+    def save(self, file_path):
+        """
+        returns: nothing; writes the vocabulary, the tokenizer config &
+            options as JSON
+        """
+        with open(file_path, 'w', encoding='utf-8') as fh:
+            json.dump({'terms': self.terms, 'tokenizer': self.tokenizer,
+                       'sparse': self.sparse, 'dtype': self.dtype.str,
+                       'version': self.version}, fh)
+
+    @classmethod
+    def load(cls, file_path, tokenize=None):
+        """
+        returns: a fitted CountVectorizer
+        pass in: path to a file written by CountVectorizer.save, & the
+            text_prep.Tokenizer new data will be tokenized w/; raises
+            ValueError if its config differs from the one saved, as the
+            terms would no longer match the columns
+        """
+        with open(file_path, encoding='utf-8') as fh:
+            cfg = json.load(fh)
+        vec = cls(cfg['sparse'], cfg['dtype']).fit(cfg['terms'])
+        assert vec.version == cfg['version'], "vocabulary file is corrupt"
+        vec.tokenizer = cfg.get('tokenizer')
+        _check_tokenizer(vec.tokenizer, tokenize)
+        return vec
+
+
+def _check_tokenizer(saved, tokenize):
+    # a vocabulary saved w/o a config can't be checked
+    if tokenize is None or saved is None:
+        return
+    if tokenize.config() != saved:
+        raise ValueError("tokenizer config {0} differs from the one the vocabulary "
+                         "was built w/, {1}".format(tokenize.config(), saved))
+
+
+def _coo_matrix(rows, cols, shape, sparse, dtype):
+    # one value per (row, col) entry; repeats are summed
+    if sparse:
+        return SPS.csr_matrix((NP.ones(rows.shape[0], dtype=dtype), (rows, cols)), shape=shape)
+    return _dense_counts(rows, cols, shape, dtype)
+
+
+class PairVectorizer:
+    """
+    unigram columns (as CountVectorizer) followed by two kinds of pair
+    columns, all filled in the same pass over the tokens:
+        adjacent bigrams, 'w1 w2': number of times w2 directly follows w1
+        co-occurring pairs, 'w1 & w2': 1 if the document holds both terms
+    pairs found in fewer than min_count documents at fit are pruned, so
+    the extra columns are bounded by the corpus, not by vocab ** 2
+
+    pass in:
+        bigrams: add adjacent bigram columns, default is True
+        max_bigrams: keep at most this many bigrams, most frequent first,
+            default is 4096; None keeps every bigram found in min_count
+            documents, which on a large corpus can be most of vocab ** 2
+        sparse: return scipy.sparse CSR matrices, default is True
+        dtype: value type, default is float64
+    """
+
+    def __init__(self, bigrams=True, max_bigrams=2**12, sparse=True, dtype=NP.float64):
+        self.use_bigrams = bigrams
+        self.max_bigrams = max_bigrams
+        self.sparse = sparse
+        self.dtype = NP.dtype(dtype)
+        self.terms = None
+        self.tokenizer = None
+
+    def fit(self, data, feature_vector, pairs=(), min_count=2, tokenize=None):
+        """
+        returns: self
+        pass in:
+            (i) the data: an EncodedCorpus, or a nested list of terms
+                (encoded first, so counting needs no per-pair dicts);
+            (ii) the unigram feature vector, a list of terms;
+            (iii) candidate co-occurring pairs, 2-tuples of unigram
+                terms, eg, from cooccurrence.top_pairs;
+            (iv) min_count: minimum document frequency of a kept bigram
+                or pair;
+            (v) the text_prep.Tokenizer that produced the terms, as in
+                CountVectorizer.fit
+        """
+        corpus = _as_corpus(data)
+        self.terms = list(dict.fromkeys(feature_vector))
+        self.tokenizer = tokenize.config() if tokenize is not None else None
+        self.bigrams, self.pairs = [], []
+        self._index()
+        if self.use_bigrams:
+            V = len(corpus.vocab)
+            keys, docs = self._bigram_keys(corpus)
+            # document frequency: distinct (bigram, document) pairs
+            order = NP.lexsort((docs, keys))
+            keys, docs = keys[order], docs[order]
+            first = NP.ones(keys.shape[0], dtype=bool)
+            first[1:] = (keys[1:] != keys[:-1]) | (docs[1:] != docs[:-1])
+            uniq, df = NP.unique(keys[first], return_counts=True)
+            df[df < min_count] = 0
+            top = top_k_ids(df, df.shape[0] if self.max_bigrams is None else self.max_bigrams)
+            self.bigrams = list(zip(corpus.vocab.decode(uniq[top] // V),
+                                    corpus.vocab.decode(uniq[top] % V)))
+        # co-occurrence is symmetric: (a, b) & (b, a) are one column
+        uniq = {}
+        for a, b in pairs:
+            if a != b:
+                uniq.setdefault(tuple(sorted((a, b))), (a, b))
+        pairs = list(uniq.values())
+        missing = {t for pair in pairs for t in pair} - set(self.lut)
+        if missing:
+            raise ValueError("pair terms not in the feature vector: {0}".format(sorted(missing)))
+        if pairs:
+            self.pairs = pairs
+            self._index()
+            _, df = self._pair_entries(corpus)
+            self.pairs = [p for p, n in zip(pairs, df) if n >= min_count]
+        self._index()
+        return self
+
+    def _index(self):
+        self.lut = {t: i for i, t in enumerate(self.terms)}
+        n = len(self.terms)
+        self.bigram_lut = {bg: n + i for i, bg in enumerate(self.bigrams)}
+        n += len(self.bigrams)
+        self.pair_cols = NP.array([[self.lut[a], self.lut[b]] for a, b in self.pairs],
+                                  dtype=NP.int64).reshape(-1, 2)
+        self.n_features = n + len(self.pairs)
+
+    @staticmethod
+    def _bigram_keys(corpus):
+        # key a * V + b for each adjacent (a, b) inside one document
+        ids, docs = corpus.tokens.astype(NP.int64), corpus.doc_ids()
+        inside = docs[:-1] == docs[1:]
+        return (ids[:-1] * len(corpus.vocab) + ids[1:])[inside], docs[:-1][inside]
+
+    def _pair_entries(self, corpus, uni=None):
+        # (rows, cols) of the pair columns & document frequency per pair
+        if uni is None:
+            uni = self._unigram_entries(corpus)
+        Xb = SPS.csr_matrix((NP.ones(uni[0].shape[0], dtype=NP.int32), uni),
+                            shape=(len(corpus), len(self.terms)))
+        Xb.data[:] = 1
+        P = Xb[:, self.pair_cols[:, 0]].multiply(Xb[:, self.pair_cols[:, 1]]).tocoo()
+        df = NP.bincount(P.col, minlength=len(self.pairs))
+        return (P.row.astype(NP.int64), P.col + self.n_features - len(self.pairs)), df
+
+    def _unigram_entries(self, corpus):
+        lut = NP.full(len(corpus.vocab), -1, dtype=NP.int64)
+        for col, term in enumerate(self.terms):
+            if term in corpus.vocab:
+                lut[corpus.vocab.index[term]] = col
+        cols = lut[corpus.tokens]
+        keep = cols >= 0
+        return corpus.doc_ids()[keep], cols[keep]
+
+    def feature_names(self):
+        """
+        returns: python list of column names, in column order
+        """
+        return (self.terms + [' '.join(bg) for bg in self.bigrams] +
+                [' & '.join(p) for p in self.pairs])
+
+    @property
+    def version(self):
+        blob = '\n'.join(self.feature_names()).encode('utf-8')
+        return hashlib.sha1(blob).hexdigest()[:16]
+
+    def transform(self, data):
+        """
+        returns: feature matrix, one row per data instance, unigram, then
+            bigram, then pair columns
+        pass in: an EncodedCorpus (vectorized over the token ids), or a
+            nested list of terms (one python loop over each document)
+        """
+        assert self.terms is not None, "call fit (or load) first"
+        shape = (len(data), self.n_features)
+        if isinstance(data, EncodedCorpus):
+            uni = self._unigram_entries(data)
+            rows, cols = [uni[0]], [uni[1]]
+            if self.bigrams:
+                rows_b, cols_b = self._bigram_entries(data)
+                rows.append(rows_b)
+                cols.append(cols_b)
+            if self.pairs:
+                (rows_p, cols_p), _ = self._pair_entries(data, uni)
+                rows.append(rows_p)
+                cols.append(cols_p)
+            return _coo_matrix(NP.concatenate(rows), NP.concatenate(cols), shape,
+                               self.sparse, self.dtype)
+        lut, blut = self.lut, self.bigram_lut
+        base = self.n_features - len(self.pairs)
+        # pair columns keyed by their first term's unigram column
+        by_first = {}
+        for i, (a, b) in enumerate(self.pair_cols.tolist()):
+            by_first.setdefault(a, []).append((b, base + i))
+        rows, cols = [], []
+        for r, line in enumerate(data):
+            seen, prev = set(), None
+            for w in line:
+                c = lut.get(w)
+                if c is not None:
+                    cols.append(c)
+                    seen.add(c)
+                c = blut.get((prev, w))
+                if c is not None:
+                    cols.append(c)
+                prev = w
+            for a in seen & by_first.keys():
+                cols.extend(c for b, c in by_first[a] if b in seen)
+            rows.extend([r] * (len(cols) - len(rows)))
+        return _coo_matrix(NP.array(rows, dtype=NP.int64), NP.array(cols, dtype=NP.int64),
+                           shape, self.sparse, self.dtype)
+
+    def _bigram_entries(self, corpus):
+        V = len(corpus.vocab)
+        a = corpus.vocab.encode((bg[0] for bg in self.bigrams), grow=False).astype(NP.int64)
+        b = corpus.vocab.encode((bg[1] for bg in self.bigrams), grow=False).astype(NP.int64)
+        known = (a >= 0) & (b >= 0)
+        fitted = a[known] * V + b[known]
+        order = NP.argsort(fitted)
+        fitted, fitted_cols = fitted[order], (len(self.terms) + NP.flatnonzero(known))[order]
+        keys, docs = self._bigram_keys(corpus)
+        if not fitted.shape[0]:
+            return docs[:0], docs[:0]
+        pos = NP.minimum(NP.searchsorted(fitted, keys), fitted.shape[0] - 1)
+        hit = fitted[pos] == keys
+        return docs[hit], fitted_cols[pos[hit]]
+
+    def fit_transform(self, data, feature_vector, pairs=(), min_count=2, tokenize=None):
+        return self.fit(data, feature_vector, pairs, min_count, tokenize).transform(data)
+
+    def save(self, file_path):
+        """
+        returns: nothing; writes the columns & options as JSON
+        """
+        with open(file_path, 'w', encoding='utf-8') as fh:
+            json.dump({'terms': self.terms, 'bigrams': self.bigrams, 'pairs': self.pairs,
+                       'tokenizer': self.tokenizer, 'sparse': self.sparse,
+                       'dtype': self.dtype.str, 'version': self.version}, fh)
+
+    @classmethod
+    def load(cls, file_path, tokenize=None):
+        """
+        returns: a fitted PairVectorizer
+        pass in: path to a file written by PairVectorizer.save, & the
+            text_prep.Tokenizer new data will be tokenized w/ (checked
+            as in CountVectorizer.load)
+        """
+        with open(file_path, encoding='utf-8') as fh:
+            cfg = json.load(fh)
+        vec = cls(bool(cfg['bigrams']), len(cfg['bigrams']), cfg['sparse'], cfg['dtype'])
+        vec.terms = cfg['terms']
+        vec.bigrams = [tuple(bg) for bg in cfg['bigrams']]
+        vec.pairs = [tuple(p) for p in cfg['pairs']]
+        vec._index()
+        assert vec.version == cfg['version'], "vocabulary file is corrupt"
+        vec.tokenizer = cfg.get('tokenizer')
+        _check_tokenizer(vec.tokenizer, tokenize)
+        return vec
+
+
+def _as_corpus(data):
+    if isinstance(data, EncodedCorpus):
+        return data
+    return EncodedCorpus.from_documents(data, NP.zeros(len(data), dtype=NP.int8))
+
+
+class HashingVectorizer:
+    """
+    vectorizer w/ no vocabulary & no fit: each term is mapped to one of
+    n_features columns by crc32 (fast, non-cryptographic & the same in
+    every process), so any chunk of the corpus can be vectorized
+    independently, in any worker, w/o a counting pass first
+
+    pass in:
+        n_features: number of columns, a power of two, at most 2**30,
+            default is 2**18
+        signed: if True, a second bit of the hash picks +1 or -1 for
+            each term, so colliding terms tend to cancel rather than
+            pile up (the expected value of each inner product is kept)
+        dtype: value type, default is float64
+    """
+
+    def __init__(self, n_features=2**18, signed=True, dtype=NP.float64):
+        # a power of two, so the column is the low bits of the hash &
+        # the sign bit (bit 31) is independent of it
+        if not (0 < n_features <= 2**30 and n_features & (n_features - 1) == 0):
+            raise ValueError("n_features must be a power of two <= 2**30, not {0}".format(n_features))
+        self.n_features = n_features
+        self.signed = signed
+        self.dtype = NP.dtype(dtype)
+
+    def hash_terms(self, terms):
+        """
+        returns: (columns, signs) 2-tuple of 1D arrays, one entry per term
+        """
+        h = NP.fromiter((zlib.crc32(t.encode('utf-8')) for t in terms),
+                        dtype=NP.int64, count=len(terms))
+        cols = h & (self.n_features - 1)
+        if self.signed:
+            # the columns use only bits 0 .. 29
+            signs = NP.where(h >> 31, -1, 1).astype(self.dtype)
+        else:
+            signs = NP.ones(h.shape[0], dtype=self.dtype)
+        return cols, signs
+
+    def transform(self, data):
+        """
+        returns: scipy.sparse CSR matrix, one row per data instance, w/
+            n_features columns
+        pass in: an EncodedCorpus (each vocabulary term is hashed once),
+            or a nested list of terms (each distinct term in the batch is
+            hashed once)
+        """
+        if isinstance(data, EncodedCorpus):
+            cols, signs = self.hash_terms(data.vocab.terms)
+            indices, values, indptr = cols[data.tokens], signs[data.tokens], data.offsets
+        else:
+            # batch-local memo: Zipfian tokens make most lookups hits
+            memo = {}
+            ids, indptr = [], [0]
+            for line in data:
+                ids.extend(memo.setdefault(w, len(memo)) for w in line)
+                indptr.append(len(ids))
+            cols, signs = self.hash_terms(list(memo))
+            ids = NP.array(ids, dtype=NP.int64)
+            indices, values = cols[ids], signs[ids]
+            indptr = NP.array(indptr, dtype=NP.int64)
+        X = SPS.csr_matrix((values, indices, indptr), shape=(len(indptr) - 1, self.n_features))
+        X.sum_duplicates()
+        X.eliminate_zeros()
+        return X
+
+
+def _hash_chunk(args):
+    vec, tokenize, file_path, start, end, encoding = args
+    return vec.transform([tokenize(line) for line in read_chunk(file_path, start, end, encoding)])
+
+
+def hash_vectorize_file(data_file, vec, tokenize=normalize, n_workers=None,
+                        chunk_size=2**24, encoding='utf-8'):
+    """
+    returns: scipy.sparse CSR matrix, one row per line of data_file
+    pass in:
+        (i) absolute path to the data file;
+        (ii) a HashingVectorizer;
+        (iii) callable that maps one raw line to a list of tokens (must
+            be picklable);
+        (iv) number of worker processes, default is os.cpu_count();
+        (v) chunk size in bytes, default is 16 MB
+    each line-aligned chunk is tokenized & hashed in a worker, w/ no
+        shared vocabulary; the chunk matrices are stacked in file order
+    """
+    tasks = [(vec, tokenize, data_file, start, end, encoding)
+             for start, end in line_chunks(data_file, chunk_size)]
+    if not tasks:
+        return SPS.csr_matrix((0, vec.n_features), dtype=vec.dtype)
+    with MP.Pool(n_workers or os.cpu_count()) as pool:
+        return SPS.vstack(pool.map(_hash_chunk, tasks), format='csr')
@@ -0,0 +1,148 @@
+# coding: utf-8
+
+"""
+feature weighting: term weight vectors computed in one vectorized pass
+over the per-class count arrays of a TermCounts, & applied to a feature
+matrix as a diagonal scaling, X . diag(w), w/o densifying a sparse X
+"""
+
+import numpy as NP
+from scipy import sparse as SPS
+
+
+def class_ratio_weights(tc, label, alpha=1., normalize=False):
+    """
+    returns: 1D float64 array, one weight per vocabulary term:
+        (n_c + alpha) / (n_rest + alpha), where n_c is the term's count
+        in class 'label' & n_rest its count in every other class
+    pass in:
+        (i) a term_counts.TermCounts;
+        (ii) the class whose terms are up-weighted;
+        (iii) alpha, additive smoothing, so terms absent from the other
+            classes get a finite weight (the notebooks' '+1');
+        (iv) if True, compare smoothed per-class term frequencies,
+            (n_c + alpha) / (N_c + alpha * V), rather than raw counts,
+            so the larger class isn't favoured
+    """
+    c = tc.counts[tc.class_row(label)].astype(NP.float64)
+    rest = tc.counts.sum(axis=0) - c
+    if not normalize:
+        return (c + alpha) / (rest + alpha)
+    V = c.shape[0]
+    return ((c + alpha) / (c.sum() + alpha * V)) / ((rest + alpha) / (rest.sum() + alpha * V))
+
+
+def idf_weights(tc, kind='smooth'):
+    """
+    returns: 1D float64 array of inverse document frequencies, one per
+        vocabulary term, from the document frequencies of all classes
+    pass in:
+        (i) a term_counts.TermCounts;
+        (ii) kind: 'smooth', log((1 + N) / (1 + df)) + 1, or 'bm25',
+            log(1 + (N - df + .5) / (df + .5))
+    """
+    df = tc.doc_freq.sum(axis=0).astype(NP.float64)
+    N = float(tc.n_docs.sum())
+    if kind == 'smooth':
+        return NP.log((1 + N) / (1 + df)) + 1
+    if kind == 'bm25':
+        return NP.log1p((N - df + .5) / (df + .5))
+    raise ValueError("kind must be 'smooth' or 'bm25', not {0!r}".format(kind))
+
+
+def column_weights(weights, vocab, terms, fill=1.):
+    """
+    returns: 1D float64 array of weights in column order
+    pass in:
+        (i) weights indexed by term id, eg, from class_ratio_weights;
+        (ii) the Vocabulary those ids come from;
+        (iii) the feature columns' terms, eg, CountVectorizer.terms;
+        (iv) weight for terms not in the vocabulary
+    """
+    ids = vocab.encode(terms, grow=False)
+    w = NP.full(ids.shape[0], fill, dtype=NP.float64)
+    known = ids >= 0
+    w[known] = weights[ids[known]]
+    return w
+
+
+def _float_copy(X):
+    # weights are fractional: integer counts become float64
+    dtype = X.dtype if X.dtype.kind == 'f' else NP.float64
+    if SPS.issparse(X):
+        return SPS.csr_matrix(X, dtype=dtype, copy=True)
+    return NP.array(X, dtype=dtype)
+
+
+def _row_of_entry(X):
+    return NP.repeat(NP.arange(X.shape[0]), NP.diff(X.indptr))
+
+
+def scale_columns(X, w):
+    """
+    returns: X . diag(w), the same kind (dense or CSR) as X, float32
+        if X is float32, else float64
+    pass in: feature matrix & 1D array, one weight per column
+    a sparse X is scaled entry by entry, so only its stored values are
+        copied; a dense X is scaled by broadcasting
+    """
+    w = NP.asarray(w)
+    X = _float_copy(X)
+    if SPS.issparse(X):
+        X.data *= w[X.indices].astype(X.dtype)
+    else:
+        X *= w.astype(X.dtype)
+    return X
+
+
+def scale_rows(X, r):
+    """
+    returns: diag(r) . X, the same kind (dense or CSR) as X, float32
+        if X is float32, else float64
+    """
+    r = NP.asarray(r)
+    X = _float_copy(X)
+    if SPS.issparse(X):
+        X.data *= r[_row_of_entry(X)].astype(X.dtype)
+    else:
+        X *= r[:, None].astype(X.dtype)
+    return X
+
+
+def l2_normalize(X):
+    """
+    returns: X w/ each non-zero row scaled to unit euclidean length
+    """
+    sq = X.multiply(X).sum(axis=1) if SPS.issparse(X) else (X * X).sum(axis=1)
+    norms = NP.sqrt(NP.asarray(sq, dtype=NP.float64).ravel())
+    return scale_rows(X, NP.divide(1., norms, out=NP.zeros_like(norms), where=norms > 0))
+
+
+def tfidf(X, idf, norm=True):
+    """
+    returns: TF-IDF weighted X, rows l2-normalized if norm is True
+    pass in: (documents x features) term count matrix & the columns'
+        idf weights (eg, column_weights(idf_weights(tc), ...))
+    """
+    X = scale_columns(X, idf)
+    return l2_normalize(X) if norm else X
+
+
+def bm25(X, idf, k1=1.2, b=.75):
+    """
+    returns: Okapi BM25 weighted X, one score per (document, term):
+        idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len))
+    pass in: (documents x features) term count matrix, the columns' idf
+        weights (eg, idf_weights(tc, 'bm25')), k1 (tf saturation) & b
+        (document length normalization)
+    document length is the row sum of X, ie, counted over the features
+    """
+    idf = NP.asarray(idf)
+    sparse = SPS.issparse(X)
+    X = SPS.csr_matrix(_float_copy(X))
+    dl = NP.asarray(X.sum(axis=1), dtype=NP.float64).ravel()
+    avg = dl.mean() if dl.shape[0] and dl.mean() > 0 else 1.
+    tf = X.data.astype(NP.float64)
+    denom = tf + k1 * (1 - b + b * dl[_row_of_entry(X)] / avg)
+    X.data = (idf[X.indices] * tf * (k1 + 1) / denom).astype(X.dtype)
+    return X if sparse else X.toarray()